@@ -0,0 +1,139 @@
+#  -*- coding: utf-8 -*-
+"""
+Runs VueDecompiler.decompile end to end on a build generated by generate_build (or on a real one
+with --source), first with an empty cache (cold) and then with the cache it left (warm).
+Every run is made in a fresh process and reports the wall time, the time spent in each phase
+(as recorded by the decompiler's Instrumentation, including the worker processes) and
+the peak RSS.
+
+The results are saved as JSON, --baseline prints the change against results saved before,
+e.g. by another commit.
+
+Usage: python -m benchmarks.decompile_benchmark [--source DIR | build options] [--jobs N]
+           [--no-beautify] [--output results.json] [--baseline old.json]
+"""
+__author__ = "kubik.augustyn@post.cz"
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.generate_build import addBuildArguments, buildOptionsFromArguments, generateBuild
+from vuedec import Instrumentation, VueDecompiler
+
+
+def peakRSS() -> int | None:
+    """The peak RSS of this process and of its (finished) worker processes, in bytes."""
+    if resource is None:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    unit = 1 if sys.platform == "darwin" else 1024
+    return unit * (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def runOnce(source: str, target: str, cache: str, jobs: int, beautify: bool,
+            verbose: bool) -> dict:
+    instrumentation = Instrumentation()
+    os.makedirs(target, exist_ok=True)
+    with open(os.devnull, "w") as devnull:
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            VueDecompiler(source, target, cache, beautify=beautify,
+                          instrumentation=instrumentation).decompile(jobs)
+            wall = time.perf_counter() - start
+    # A fresh process, so the cache stats are the run's own
+    return {"wall": wall, "phases": instrumentation.phaseTotals(), "peakRSS": peakRSS(),
+            "components": sum(1 for name in os.listdir(target) if name.endswith(".vue")),
+            "caches": VueDecompiler.cacheStats()}
+
+
+def gitCommit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printRun(name: str, run: dict, baseline: dict | None):
+    def change(value: float, old: float | None) -> str:
+        if not old:
+            return ""
+        return f" ({(value - old) / old:+.1%})"
+
+    rss = f"{run['peakRSS'] / 2 ** 20:.1f}MB" if run["peakRSS"] is not None else "n/a"
+    print(f"{name}: {run['wall']:.3f}s{change(run['wall'], baseline and baseline['wall'])},"
+          f" peak RSS {rss}, {run['components']} components")
+    for phase, measured in run["phases"].items():
+        old = baseline and baseline["phases"].get(phase, {}).get("seconds")
+        print(f"  {phase:<13} {measured['seconds']:>9.3f}s{change(measured['seconds'], old)}"
+              f" ({measured['count']} runs, {measured['bytes']} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="a build to decompile instead of a generated one")
+    addBuildArguments(parser)
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="decompiler worker processes")
+    parser.add_argument("--no-beautify", action="store_true", help="parse the minified source")
+    parser.add_argument("-o", "--output", default="benchmark-results.json",
+                        help="where to save the results")
+    parser.add_argument("--baseline", help="results to compare with")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the decompiler output")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": gitCommit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"source": args.source, "jobs": args.jobs, "beautify": not args.no_beautify},
+        "runs": {}
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.source
+        if source is None:
+            options = buildOptionsFromArguments(args)
+            results["options"]["build"] = vars(options)
+            source = os.path.join(tmp, "build")
+            generateBuild(source, options)
+        cache = os.path.join(tmp, "cache")
+        os.makedirs(cache)
+
+        spawn = multiprocessing.get_context("spawn")
+        for name in ("cold", "warm"):
+            # A fresh process, so that nothing is kept in memory between the runs
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=spawn) as executor:
+                run = executor.submit(runOnce, source, os.path.join(tmp, f"target-{name}"), cache,
+                                      args.jobs, not args.no_beautify, args.verbose).result()
+            results["runs"][name] = run
+            printRun(name, run, baseline and baseline["runs"].get(name))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved the results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
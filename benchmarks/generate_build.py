@@ -0,0 +1,222 @@
+#  -*- coding: utf-8 -*-
+"""
+Writes a synthetic, minified Vue 3 build: an index.js exporting the runtime helpers and title-cased
+chunks importing them. Every chunk holds a few components (defineComponent + a render function
++ _export_sfc) whose templates use hoisted vnodes, slots, renderList, v-if and withDirectives.
+
+Usage: python -m benchmarks.generate_build <target dir> [--chunks N] [--components N]
+           [--depth N] [--breadth N] [--seed N]
+"""
+__author__ = "kubik.augustyn@post.cz"
+
+import argparse
+import os
+import random
+from dataclasses import dataclass
+
+# The helpers index.js exports, in the export order
+HELPERS: list[str] = [
+    "openBlock", "createElementBlock", "createBlock", "createBaseVNode", "createVNode",
+    "createTextVNode", "createCommentVNode", "toDisplayString", "renderList", "renderSlot",
+    "withCtx", "withDirectives", "vModelText", "normalizeClass", "resolveComponent", "Fragment",
+    "defineComponent", "_export_sfc", "ref", "computed"
+]
+# Helpers that are values in the runtime, not functions
+_VALUE_HELPERS: set[str] = {"Fragment", "vModelText"}
+_TAGS: list[str] = ["div", "section", "ul", "li", "span", "p", "article", "header", "footer"]
+
+
+@dataclass
+class BuildOptions:
+    chunks: int = 20
+    components: int = 3  # Per chunk
+    depth: int = 6  # Template nesting
+    breadth: int = 3  # Children per element
+    seed: int = 0
+
+
+def shortNames(prefix: str):
+    """Minifier-like names, which can't clash with the keywords or the render parameters."""
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    for first in alphabet:
+        yield prefix + first
+    for first in alphabet:
+        for second in alphabet:
+            yield prefix + first + second
+
+
+def generateIndex() -> str:
+    parts = []
+    for helper in HELPERS:
+        if helper in _VALUE_HELPERS:
+            parts.append(f'const {helper}=Symbol("{helper}");')
+        else:
+            parts.append(f"function {helper}(e,t,n){{return e}}")
+    exports = ",".join(f"{helper} as {name}" for helper, name in zip(HELPERS, shortNames("X")))
+    return "".join(parts) + f"export{{{exports}}};"
+
+
+class ChunkWriter:
+    """Writes one chunk, keeping the helpers' local names and the hoisted vnodes."""
+    options: BuildOptions
+    random: random.Random
+    local: dict[str, str]  # Helper --> its local name within the chunk
+    hoisted: dict[str, str]  # Hoisted vnode code --> its var name, reused by equal vnodes
+    childComponents: list[str]  # Resolved component names usable in the templates
+
+    def __init__(self, options: BuildOptions, seed: int):
+        self.options = options
+        self.random = random.Random(seed)
+        self.local = dict(zip(HELPERS, shortNames("A")))
+        self.hoisted = {}
+        self.childComponents = []
+
+    def call(self, helper: str, *arguments: str) -> str:
+        return f"{self.local[helper]}({','.join(arguments)})"
+
+    def hoist(self, code: str) -> str:
+        if code not in self.hoisted:
+            self.hoisted[code] = f"H{len(self.hoisted)}"
+        return self.hoisted[code]
+
+    def props(self, level: int) -> str:
+        kind = self.random.random()
+        if kind < 0.3:
+            return "null"
+        if kind < 0.6:
+            return f'{{class:"level-{level} item-{self.random.randint(0, 99)}"}}'
+        if kind < 0.8:
+            normalized = self.call("normalizeClass", f'["box",{{active:e.active{level}}}]')
+            return f"{{class:{normalized},key:{level}}}"
+        return f'{{id:"node-{level}",title:e.title}}'
+
+    def element(self, level: int) -> str:
+        tag = self.random.choice(_TAGS)
+        if level >= self.options.depth:
+            return self.leaf(level)
+        children = ",".join(self.node(level + 1) for _ in range(self.options.breadth))
+        return self.call("createBaseVNode", f'"{tag}"', self.props(level), f"[{children}]")
+
+    def leaf(self, level: int) -> str:
+        kind = self.random.random()
+        if kind < 0.4:
+            return self.call("createTextVNode", f'"Static text {level}"')
+        if kind < 0.7:
+            displayed = self.call("toDisplayString", f"e.label{level}")
+            return self.call("createTextVNode", displayed, "1")
+        if kind < 0.85:
+            # Hoisted static vnode, referenced like Vue's compiler does
+            return self.hoist(self.call("createBaseVNode", '"span"', '{class:"static"}',
+                                        f'"Hoisted {level}"', "-1"))
+        return self.call("renderSlot", "e.$slots", '"default"')
+
+    def node(self, level: int) -> str:
+        if level >= self.options.depth:
+            return self.leaf(level)
+        kind = self.random.random()
+        if kind < 0.45:
+            return self.element(level)
+        if kind < 0.6:
+            # v-if
+            block = self.call("createElementBlock", '"div"', f"{{key:{level}}}",
+                              f"[{self.element(level + 1)}]")
+            comment = self.call("createCommentVNode", '"v-if"', "!0")
+            return f"e.show{level}?({self.call('openBlock')},{block}):{comment}"
+        if kind < 0.75:
+            # v-for
+            item = self.call("openBlock") + "," + self.call(
+                "createElementBlock", '"li"', "{key:r.id}",
+                f"[{self.node(level + 1)}]")
+            items = self.call("renderList", f"e.items{level}", f"r=>({item})")
+            fragment = self.call("createElementBlock", self.local["Fragment"], "null", items, "128")
+            return f"({self.call('openBlock', '!0')},{fragment})"
+        if kind < 0.9 and self.childComponents:
+            # A component with slots
+            component = self.random.choice(self.childComponents)
+            slots = (f"{{default:{self.call('withCtx', f'()=>[{self.node(level + 1)}]')},"
+                     f"header:{self.call('withCtx', f'()=>[{self.leaf(level + 1)}]')},_:1}}")
+            return self.call("createVNode", component, '{title:"child"}', slots)
+        # v-model
+        handler = f"t[{level}]||(t[{level}]=r=>e.text{level}=r)"
+        inputNode = self.call("createBaseVNode", '"input"', f'{{"onUpdate:modelValue":{handler}}}',
+                              "null", "512")
+        directives = f"[[{self.local['vModelText']},e.text{level}]]"
+        return self.call("withDirectives", inputNode, directives)
+
+    def component(self, chunk: int, index: int, children: list[tuple[str, str]]) -> str:
+        """children are the (component name, var name) of the chunk's other components."""
+        name = f"Chunk{chunk}Item{index}"
+        resolved = []
+        self.childComponents = []
+        for i, (childName, _) in enumerate(children):
+            resolved.append(f'const c{i}={self.call("resolveComponent", f'"{childName}"')};')
+            self.childComponents.append(f"c{i}")
+        template = self.call("createElementBlock", '"div"', '{class:"component"}',
+                             f"[{self.node(0)}]")
+        render = (f"function R{index}(e,t,n,s,i,l){{{''.join(resolved)}"
+                  f"return {self.call('openBlock')},{template}}}")
+        components = ",".join(f"{childName}:{var}" for childName, var in children)
+        options = (f'{{name:"{name}",components:{{{components}}},props:{{title:String}},'
+                   f'data(){{return{{items:[],text:""}}}}}}')
+        definition = f"const D{index}={self.call('defineComponent', options)};"
+        info = f'[["render",R{index}],["__scopeId","data-v-{chunk:04x}{index:04x}"]]'
+        sfc = f"const C{index}={self.call('_export_sfc', f'D{index}', info)};"
+        return definition + render + sfc
+
+    def write(self, chunk: int) -> str:
+        count = self.options.components
+        # The last component is the chunk's export, using the others
+        bodies = [self.component(chunk, index,
+                                 [(f"Chunk{chunk}Item{other}", f"C{other}")
+                                  for other in range(index)] if index == count - 1 else [])
+                  for index in range(count)]
+        imports = ",".join(f"{exported} as {self.local[helper]}"
+                           for helper, exported in zip(HELPERS, shortNames("X")))
+        hoisted = "".join(f"const {name}={code};" for code, name in self.hoisted.items())
+        return (f'import{{{imports}}}from"./index.js";' + hoisted +
+                "".join(bodies) + f"export{{C{count - 1} as default}};")
+
+
+def generateBuild(path: str, options: BuildOptions) -> list[str]:
+    """Writes the build into the directory, returning the chunk file names."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "index.js"), "w", encoding="utf-8") as f:
+        f.write(generateIndex())
+    fileNames = []
+    for chunk in range(options.chunks):
+        file_name = f"Chunk{chunk}-{random.Random(options.seed + chunk).getrandbits(32):08x}.js"
+        with open(os.path.join(path, file_name), "w", encoding="utf-8") as f:
+            f.write(ChunkWriter(options, options.seed * 100003 + chunk).write(chunk))
+        fileNames.append(file_name)
+    return fileNames
+
+
+def addBuildArguments(parser: argparse.ArgumentParser):
+    defaults = BuildOptions()
+    parser.add_argument("--chunks", type=int, default=defaults.chunks, help="chunk files")
+    parser.add_argument("--components", type=int, default=defaults.components,
+                        help="components per chunk")
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="template depth")
+    parser.add_argument("--breadth", type=int, default=defaults.breadth,
+                        help="children per template element")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def buildOptionsFromArguments(args: argparse.Namespace) -> BuildOptions:
+    return BuildOptions(args.chunks, args.components, args.depth, args.breadth, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", help="directory to write the build into")
+    addBuildArguments(parser)
+    args = parser.parse_args()
+
+    fileNames = generateBuild(args.target, buildOptionsFromArguments(args))
+    size = sum(os.path.getsize(os.path.join(args.target, name)) for name in fileNames)
+    print(f"Wrote index.js and {len(fileNames)} chunks ({size} bytes) to {args.target}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#  -*- coding: utf-8 -*-
+"""
+Compares parsing the beautified source (the default) with parsing the minified source directly
+(--no-beautify) on real chunk files.
+
+Usage: python benchmarks/parse_benchmark.py <source dir> [file name ...] [--repeat N]
+"""
+__author__ = "kubik.augustyn@post.cz"
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+import jsbeautifier
+from kutil.language.languages.javascript import parseModule
+from kutil.language.languages.javascript.JSOptions import JSOptions
+
+
+def parseBeautified(source: str):
+    return parseModule(jsbeautifier.beautify(source).replace("\r\n", "\n"), JSOptions())
+
+
+def parseMinified(source: str):
+    return parseModule(source, JSOptions())
+
+
+def measureTime(fn, source: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(source)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measurePeakMemory(fn, source: str) -> int:
+    # Measured separately from the time, tracemalloc slows the allocations down a lot
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory with the built app's JS files")
+    parser.add_argument("files", nargs="*", help="files to measure (default: all the chunks)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file, the best counts")
+    args = parser.parse_args()
+
+    fileNames = args.files or sorted(
+        name for name in os.listdir(args.source)
+        if name.endswith(".js") and not name.endswith(".min.js") and name[0].istitle())
+
+    print(f"{'file':<40} {'size':>9} {'beautified':>12} {'minified':>12}"
+          f" {'peak beautified':>16} {'peak minified':>14}")
+    totals = [0, 0.0, 0.0, 0, 0]
+    for file_name in fileNames:
+        with open(os.path.join(args.source, file_name), "r", encoding="utf-8") as f:
+            source = f.read()
+        row = [len(source),
+               measureTime(parseBeautified, source, args.repeat),
+               measureTime(parseMinified, source, args.repeat),
+               measurePeakMemory(parseBeautified, source),
+               measurePeakMemory(parseMinified, source)]
+        totals = [total + value for total, value in zip(totals, row)]
+        print(f"{file_name:<40} {row[0]:>9} {row[1]:>11.3f}s {row[2]:>11.3f}s"
+              f" {row[3] / 2 ** 20:>14.1f}MB {row[4] / 2 ** 20:>12.1f}MB")
+    print(f"{'total':<40} {totals[0]:>9} {totals[1]:>11.3f}s {totals[2]:>11.3f}s"
+          f" {totals[3] / 2 ** 20:>14.1f}MB {totals[4] / 2 ** 20:>12.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#  -*- coding: utf-8 -*-
+"""
+Measures the template conversion (TemplateParser.parse) on synthetic render functions nested
+hundreds of levels deep. Every level is one of an element, a v-if and a component with
+a default slot.
+
+With --compare, another TemplateParser implementation (e.g. the recursive one, saved by
+`git show <commit>:vuedec/TemplateParser.py > old.py`) is measured on the same templates,
+once at the default recursion limit and once at a raised one, and its output is compared.
+
+Usage: python -m benchmarks.template_depth_benchmark [depth ...] [--compare old.py] [--repeat N]
+"""
+__author__ = "kubik.augustyn@post.cz"
+
+import argparse
+import gc
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+from vuedec import CmdUI, Files, JSParser
+from vuedec.Component import Component
+from vuedec.TemplateParser import TemplateParser
+
+
+def generateSource(depth: int) -> str:
+    template = 'createTextVNode("leaf")'
+    for level in range(depth):
+        kind = level % 3
+        if kind == 0:
+            template = f'createBaseVNode("div", {{class: "level-{level}"}}, [{template}])'
+        elif kind == 1:
+            template = f'_ctx.show{level} ? {template} : createCommentVNode("v-if", true)'
+        else:
+            template = (f'createVNode("section", null, {{default: withCtx(() => [{template}]),'
+                        f' _: 1}})')
+    return (f"function render(_ctx, _cache) {{\n"
+            f'  return openBlock(), createElementBlock("div", null, [{template}]);\n'
+            f"}}\n")
+
+
+def loadTemplateParser(path: str) -> type:
+    spec = importlib.util.spec_from_file_location("compared_template_parser", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TemplateParser
+
+
+def measure(templateParser: type, component: Component, repeat: int,
+            recursionLimit: int | None = None) -> tuple[float | None, str]:
+    """The best time of the runs and the output, or None and the error's name."""
+    defaultLimit = sys.getrecursionlimit()
+    if recursionLimit is not None:
+        sys.setrecursionlimit(recursionLimit)
+    try:
+        best = float("inf")
+        output = ""
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            output = templateParser(component).parse(component.renderMethod)
+            best = min(best, time.perf_counter() - start)
+        return best, output
+    except RecursionError:
+        return None, "RecursionError"
+    finally:
+        sys.setrecursionlimit(defaultLimit)
+
+
+def formatSeconds(seconds: float | None) -> str:
+    return "RecursionError" if seconds is None else f"{seconds:.4f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("depths", type=int, nargs="*", default=[100, 500, 1000, 2000],
+                        help="template nesting depths to measure")
+    parser.add_argument("--compare", help="path of another TemplateParser.py to measure")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per depth, the best counts")
+    args = parser.parse_args()
+
+    compared = loadTemplateParser(args.compare) if args.compare else None
+
+    header = f"{'depth':>6} {'output':>10} {'explicit stack':>15}"
+    if compared is not None:
+        header += f" {'compared':>15} {'compared, raised limit':>23} {'same output':>12}"
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        for depth in args.depths:
+            file_name = f"Deep{depth}.js"
+            with open(os.path.join(tmp, file_name), "w", encoding="utf-8") as f:
+                f.write(generateSource(depth))
+
+            # The JS parser itself may recurse for every level
+            defaultLimit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(defaultLimit, depth * 100))
+            try:
+                sourceFile = JSParser(Files(tmp), file_name, CmdUI(), tmp, beautify=False)
+            finally:
+                sys.setrecursionlimit(defaultLimit)
+            renderMethod = sourceFile.symbols.functions["render"]
+            component = Component(sourceFile, sourceFile.ast,
+                                  sourceFile.ast.getNodes(sourceFile.entryPoint.body), None,
+                                  renderMethod, {}, {}, "index.js")
+
+            seconds, output = measure(TemplateParser, component, args.repeat)
+            row = f"{depth:>6} {len(output):>10} {formatSeconds(seconds):>15}"
+            if compared is not None:
+                limitedSeconds, _ = measure(compared, component, args.repeat)
+                raisedSeconds, comparedOutput = measure(compared, component, args.repeat,
+                                                        max(defaultLimit, depth * 100))
+                row += (f" {formatSeconds(limitedSeconds):>15} {formatSeconds(raisedSeconds):>23}"
+                        f" {'yes' if comparedOutput == output else 'NO':>12}")
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import argparse
 import os.path
 import shutil
 import sys
@@ -8,27 +9,76 @@ from vuedec import *
 
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: ")
-        sys.exit(1)
-    source = sys.argv[1]
-    target = sys.argv[2]
-    cache = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Decompiles a built Vue app")
+    parser.add_argument("source", help="directory with the built app's JS files")
+    parser.add_argument("target", help="directory to write the .vue files to")
+    parser.add_argument("cache", help="cache directory")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes decompiling the chunks,"
+                             " 0 uses all the CPU cores (default: 1)")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="keep the target directory and only decompile the changed files")
+    parser.add_argument("--no-beautify", action="store_true",
+                        help="parse the minified files directly, without beautifying them first")
+    parser.add_argument("--cache-max-bytes", type=int, default=None,
+                        help="evict the least recently used entries of each cache over this size")
+    parser.add_argument("--cache-max-entries", type=int, default=None,
+                        help="evict the least recently used entries of each cache over this count")
+    parser.add_argument("--report", default=None,
+                        help="write the time, bytes and count of every phase per chunk and"
+                             " component to this JSON file (CSV when it ends with .csv)")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="profile every chunk separately, writing its .pstats and collapsed"
+                             " stacks (for flame graphs) into DIR, and list the slowest chunks")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also trace the peak memory of every chunk and"
+                             " the allocation sites holding the most memory")
+    parser.add_argument("--json-events", action="store_true",
+                        help="write the progress as JSON lines (one event per line) instead of"
+                             " the progress line, for headless runs")
+    parser.add_argument("--prune", action="store_true",
+                        help="only drop the cache entries of files no longer in the source")
+    args = parser.parse_args()
+
+    source = args.source
+    target = args.target
+    cache = args.cache
     if not os.path.exists(source):
         print("Source path must exist")
         sys.exit(1)
     if not os.path.isdir(source):
         print("Source path must be directory XD")
         sys.exit(1)
-    if os.path.exists(target):
+    Cache.maxBytes = args.cache_max_bytes
+    Cache.maxEntries = args.cache_max_entries
+    ui = JSONLinesUI() if args.json_events else CmdUI()
+    if args.prune:
+        if not os.path.exists(cache):
+            return
+        vd = VueDecompiler(source, target, cache, beautify=not args.no_beautify)
+        vd.set_ui(ui)
+        ui.message(f"Pruned {vd.prune()} cache entries")
+        return
+
+    if os.path.exists(target) and not args.incremental:
         shutil.rmtree(target)
-    os.mkdir(target)
+    if not os.path.exists(target):
+        os.mkdir(target)
     if not os.path.exists(cache):
         os.mkdir(cache)
 
-    vd = VueDecompiler(source, target, cache)
-    # vd.set_ui(CmdUI()) - default
-    vd.decompile()
+    instrumentation = Instrumentation() if args.report else None
+    profiler = ChunkProfiler(args.profile, args.profile_memory) if args.profile else None
+    vd = VueDecompiler(source, target, cache, args.incremental, not args.no_beautify,
+                       instrumentation, profiler)
+    vd.set_ui(ui)
+    vd.decompile(args.jobs)
+    if instrumentation is not None:
+        instrumentation.writeReport(args.report)
+        ui.message(f"Wrote the report to {args.report}")
+    if profiler is not None:
+        ui.message(profiler.summary())
+        ui.message(f"Wrote the summary of all the chunks to {profiler.writeSummary()}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,69 @@
+#  -*- coding: utf-8 -*-
+__author__ = "kubik.augustyn@post.cz"
+
+from typing import Iterator
+
+from kutil.language.AST import AST
+from kutil.language.languages.javascript import nodes
+
+__all__ = ["ASTWalker"]
+
+# Node attributes that never hold child node indexes
+_NON_CHILD_FIELDS: set[str] = {"data", "type"}
+
+
+class ASTWalker:
+    """
+    Walks the nodes of an AST without recursion, so that deep trees don't hit the recursion
+    limit. The attributes holding child node indexes are looked up once per node class.
+    """
+    # Node class --> names of its attributes that may hold child node indexes
+    childFields: dict[type, tuple[str, ...]] = {}
+
+    ast: AST
+
+    def __init__(self, ast: AST):
+        self.ast = ast
+
+    @classmethod
+    def getChildFields(cls, node: nodes.Node) -> tuple[str, ...]:
+        fields = cls.childFields.get(type(node))
+        if fields is None:
+            if isinstance(node, nodes.Literal):
+                fields = ()  # Its value might be a number, which isn't an index
+            else:
+                fields = tuple(key for key in vars(node) if key not in _NON_CHILD_FIELDS)
+            cls.childFields[type(node)] = fields
+        return fields
+
+    def children(self, node: nodes.Node) -> list[nodes.Node]:
+        children = []
+        for field in self.getChildFields(node):
+            value = getattr(node, field, None)
+            if isinstance(value, bool):
+                continue  # A flag, not an index
+            if isinstance(value, int):
+                indexes = (value,)
+            elif isinstance(value, list):
+                indexes = value
+            else:
+                continue
+            for index in indexes:
+                if not isinstance(index, int) or isinstance(index, bool):
+                    continue
+                try:
+                    child = self.ast.getNode(index)
+                except IndexError:
+                    continue  # Maybe a bad index?
+                if isinstance(child, nodes.Node):
+                    children.append(child)
+        return children
+
+    def walk(self, node: nodes.Node) -> Iterator[tuple[nodes.Node, nodes.Node]]:
+        """Yields (parent, child) for all the nodes below the node, depth-first,
+        in the order of the parents' attributes."""
+        stack = [(node, child) for child in reversed(self.children(node))]
+        while stack:
+            parent, child = stack.pop()
+            yield parent, child
+            stack.extend((child, grandChild) for grandChild in reversed(self.children(child)))
@@ -1,59 +1,309 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import hashlib
 import json
+import lzma
 import os.path
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, fields
+
+# Bump when the table layout changes, the old cache is then thrown away
+_SCHEMA_VERSION = 3
+# Last access times closer than this (seconds) aren't updated, so that reads rarely write
+_ATIME_RESOLUTION = 60
+
+# Connections shared by all the Cache instances of the same database within a process
+_connections: dict[str, tuple[int, sqlite3.Connection]] = {}
+
+# Compression name --> (blob file extension, compress(data, level), decompress(data))
+_COMPRESSIONS = {
+    None: (".raw", lambda data, level: data, lambda data: data),
+    "zlib": (".zz", lambda data, level: zlib.compress(data, level), zlib.decompress),
+    "lzma": (".xz", lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+
+
+@dataclass
+class CacheStats:
+    """How a cache was used. The bytes are the stored JSON text and blob file sizes."""
+    hits: int = 0
+    misses: int = 0
+    bytesRead: int = 0
+    bytesWritten: int = 0
+    saves: int = 0  # Commits
+    jsonSeconds: float = 0.0  # Encoding and decoding the values
+
+    def add(self, other: "CacheStats"):
+        for field in fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+    def asDict(self) -> dict:
+        return asdict(self)
+
+
+# Returned for missing keys, a stored value can be None
+_MISSING = object()
+
+# Cache name --> the stats of all its instances within the process
+_stats: dict[str, CacheStats] = {}
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    pid = os.getpid()
+    if path in _connections:
+        ownerPid, connection = _connections[path]
+        # A connection inherited from the parent process (fork) must not be used
+        if ownerPid == pid:
+            return connection
+
+    connection = sqlite3.connect(path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL is still safe against corruption, only the last commits may be lost
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS entries")
+            connection.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                               " size INTEGER NOT NULL, atime REAL NOT NULL)")
+            connection.execute("CREATE INDEX entries_atime ON entries (atime)")
+            connection.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+    _connections[path] = (pid, connection)
+    return connection
 
 
 class Cache:
+    """
+    A persistent key-value store backed by an SQLite database (<name>.sqlite3), safe to use from
+    multiple processes. Every write is a single-row upsert; with save=False (or inside batch()),
+    the writes are committed together by the next save().
+
+    File entries are stored compressed in the blobs directory, named by their content's hash,
+    so identical files are only stored once, even across different caches in the same path.
+
+    When maxBytes or maxEntries is set, saving evicts the least recently used entries
+    over the budget.
+
+    The instances of the same name count their hits, misses, I/O and saves together into
+    stats, see allStats for all the caches.
+    """
+    # Used for new file entries, compression is one of None, "zlib" and "lzma"
+    compression: str | None = "zlib"
+    compressionLevel: int = 6
+    # The budget of each cache, None is unlimited. File entries count their blob's size
+    maxBytes: int | None = None
+    maxEntries: int | None = None
+
     name: str
     path: str
-    data: dict
+    stats: CacheStats
+    __connection: sqlite3.Connection
+    __batchDepth: int
 
     def __init__(self, name: str, path: str):
         self.name = name
         self.path = path
-        self.load()
+        self.__batchDepth = 0
+        self.stats = _stats.setdefault(name, CacheStats())
+        self.__connection = _connect(os.path.join(self.path, self.name + ".sqlite3"))
+        self.__importJSON()
 
-    def __open(self, mode):
+    def __importJSON(self):
+        # Caches created before the SQLite backend
         path = os.path.join(self.path, self.name + ".json")
-        # print(path, mode, os.path.exists(path))
         if not os.path.exists(path):
-            with open(path, "w+") as f:
-                f.write("{}")
-        return open(path, mode)
+            return
+        with open(path, "r") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = {}
+        for key, value in data.items():
+            legacyFilePath = os.path.join(self.path, f"{self.name}-{key}")
+            if value == legacyFilePath and os.path.exists(legacyFilePath):
+                with open(legacyFilePath, "rb") as f:
+                    self.setFileRaw(key, f.read(), False)
+                os.remove(legacyFilePath)
+            else:
+                self.set(key, value, False)
+        self.save()
+        os.remove(path)
+
+    @staticmethod
+    def allStats() -> dict[str, CacheStats]:
+        """Cache name --> a copy of its stats, for all the caches used within the process."""
+        return {name: CacheStats(**stats.asDict()) for name, stats in _stats.items()}
+
+    @staticmethod
+    def takeStats() -> dict[str, CacheStats]:
+        """Like allStats, but the stats are then reset, e.g. to hand them over
+        from a worker process to the parent, which adds them by mergeStats."""
+        taken = Cache.allStats()
+        for stats in _stats.values():
+            for field in fields(stats):
+                setattr(stats, field.name, field.default)
+        return taken
+
+    @staticmethod
+    def mergeStats(allStats: dict[str, CacheStats]):
+        for name, stats in allStats.items():
+            _stats.setdefault(name, CacheStats()).add(stats)
 
-    def load(self):
-        self.data = json.load(self.__open("r+"))
-        return self.data
+    def __decode(self, value: str):
+        start = time.perf_counter()
+        decoded = json.loads(value)
+        self.stats.jsonSeconds += time.perf_counter() - start
+        self.stats.bytesRead += len(value)
+        return decoded
+
+    def __encode(self, value) -> str:
+        start = time.perf_counter()
+        encoded = json.dumps(value)
+        self.stats.jsonSeconds += time.perf_counter() - start
+        return encoded
+
+    def load(self) -> dict:
+        cursor = self.__connection.execute("SELECT key, value FROM entries")
+        return {key: self.__decode(value) for key, value in cursor}
 
     def save(self):
-        json.dump(self.data, self.__open("w+"))
-        return self.data
+        if self.__batchDepth == 0:
+            if self.maxBytes is not None or self.maxEntries is not None:
+                self.evict()
+            self.__connection.commit()
+            self.stats.saves += 1
+
+    def evict(self) -> int:
+        """Deletes the least recently used entries until the cache fits its budget,
+        returning the number of deleted entries."""
+        entryCount, byteCount = self.__connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        toDelete: list[str] = []
+        deletedFile = False
+        if ((self.maxEntries is not None and entryCount > self.maxEntries) or
+                (self.maxBytes is not None and byteCount > self.maxBytes)):
+            cursor = self.__connection.execute("SELECT key, value, size FROM entries"
+                                               " ORDER BY atime")
+            for key, value, size in cursor:
+                if ((self.maxEntries is None or entryCount <= self.maxEntries) and
+                        (self.maxBytes is None or byteCount <= self.maxBytes)):
+                    break
+                toDelete.append(key)
+                deletedFile = deletedFile or self.__isFileEntry(json.loads(value))
+                entryCount -= 1
+                byteCount -= size
+        if len(toDelete) == 0:
+            return 0
+
+        self.__connection.executemany("DELETE FROM entries WHERE key = ?",
+                                      ((key,) for key in toDelete))
+        self.__connection.commit()
+        if deletedFile:
+            self.collectBlobs()
+        return len(toDelete)
+
+    def collectBlobs(self) -> int:
+        """Deletes the blobs no longer referenced by any cache in the path,
+        returning the number of deleted blobs."""
+        referenced: set[str] = set()
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith(".sqlite3"):
+                continue
+            connection = _connect(os.path.join(self.path, file_name))
+            for value, in connection.execute("SELECT value FROM entries"
+                                             " WHERE value LIKE '{\"blob\"%'"):
+                referenced.add(json.loads(value)["blob"])
+
+        deleted = 0
+        blobsPath = os.path.join(self.path, "blobs")
+        if not os.path.exists(blobsPath):
+            return 0
+        for directory in os.listdir(blobsPath):
+            for blobName in os.listdir(os.path.join(blobsPath, directory)):
+                digest, _, extension = blobName.partition(".")
+                if digest in referenced or extension.endswith("tmp"):
+                    continue
+                os.remove(os.path.join(blobsPath, directory, blobName))
+                deleted += 1
+        return deleted
+
+    @contextmanager
+    def batch(self):
+        """Commits all the writes made inside the block at once, regardless of their save."""
+        self.__batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.__batchDepth -= 1
+            self.save()
+
+    def keys(self) -> list[str]:
+        return [key for key, in self.__connection.execute("SELECT key FROM entries")]
 
     def get(self, key: str, default=None, reload=False):
-        if reload:
-            self.load()
-        return self.data.get(key, default)
+        # The database is always up-to-date, reload is kept for compatibility
+        value = self.__get(key)
+        self.__count(value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def __get(self, key: str):
+        """The value or _MISSING, not counted as a hit or a miss."""
+        row = self.__connection.execute("SELECT value, atime FROM entries WHERE key = ?",
+                                        (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        value, atime = row
+        now = time.time()
+        if now - atime > _ATIME_RESOLUTION:
+            self.__connection.execute("UPDATE entries SET atime = ? WHERE key = ?", (now, key))
+            if self.__batchDepth == 0:
+                self.__connection.commit()
+        return self.__decode(value)
 
     def set(self, key: str, value, save=True):
-        self.data[key] = value
+        self.__put(key, self.__encode(value), 0, save)
+
+    def __put(self, key: str, value: str, extraSize: int, save: bool):
+        self.__connection.execute("INSERT OR REPLACE INTO entries (key, value, size, atime)"
+                                  " VALUES (?, ?, ?, ?)",
+                                  (key, value, len(value) + extraSize, time.time()))
+        self.stats.bytesWritten += len(value)
         if save:
             self.save()
 
-    def __getFilePath(self, key):
-        return os.path.join(self.path, f"{self.name}-{key}")
+    def delete(self, key: str, save=True):
+        self.__connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if save:
+            self.save()
+
+    def __getBlobPath(self, digest: str, compression: str | None) -> str:
+        extension = _COMPRESSIONS[compression][0]
+        return os.path.join(self.path, "blobs", digest[:2], digest + extension)
+
+    @staticmethod
+    def __isFileEntry(entry) -> bool:
+        return isinstance(entry, dict) and entry.get("compression", "") in _COMPRESSIONS
+
+    def __getFileEntryPath(self, filename: str) -> tuple[str, str | None] | None:
+        entry = self.__get(filename)
+        if not self.__isFileEntry(entry):
+            return None
+        return self.__getBlobPath(entry["blob"], entry["compression"]), entry["compression"]
 
     def getFileRaw(self, filename: str, default=None, reload=False) -> bytes:
-        if reload:
-            self.load()
-        path = self.data.get(filename)
-        if not path:
-            path = self.__getFilePath(filename)
-        if not os.path.exists(path):
+        entryPath = self.__getFileEntryPath(filename)
+        if entryPath is None or not os.path.exists(entryPath[0]):
+            self.stats.misses += 1
             return default
+        path, compression = entryPath
         with open(path, "rb") as f:
-            return f.read()
+            stored = f.read()
+        self.stats.hits += 1
+        self.stats.bytesRead += len(stored)
+        return _COMPRESSIONS[compression][2](stored)
 
     def getFile(self, filename: str, default=None, reload=False) -> str:
         raw = self.getFileRaw(filename, default, reload)
@@ -62,28 +312,40 @@ class Cache:
         return raw.decode("utf-8")
 
     def setFileRaw(self, filename: str, value: bytes, save=True):
-        path = self.__getFilePath(filename)
-        self.data[filename] = path
-        with open(path, "wb+") as f:
-            f.write(value)
-        if save:
-            self.save()
+        digest = hashlib.blake2b(value, digest_size=20).hexdigest()
+        path = self.__getBlobPath(digest, self.compression)
+        if not os.path.exists(path):  # Otherwise it's already stored
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = _COMPRESSIONS[self.compression][1](value, self.compressionLevel)
+            # Replace the file atomically, so that a crash never leaves a partially written blob
+            tmpPath = f"{path}.{os.getpid()}.tmp"
+            with open(tmpPath, "wb+") as f:
+                f.write(compressed)
+            os.replace(tmpPath, path)
+            self.stats.bytesWritten += len(compressed)
+        entry = {"blob": digest, "compression": self.compression, "size": len(value)}
+        self.__put(filename, self.__encode(entry), os.path.getsize(path), save)
 
     def setFile(self, filename: str, value: str, save=True):
         self.setFileRaw(filename, value.encode("utf-8"), save)
 
     def has(self, key, reload=False):
-        if reload:
-            self.load()
-        return key in self.data
+        found = self.__connection.execute("SELECT 1 FROM entries WHERE key = ?",
+                                          (key,)).fetchone() is not None
+        self.__count(found)
+        return found
 
     def hasFile(self, filename, reload=False):
-        has_path = self.has(filename, reload)
-        if has_path:
-            path = self.data.get(filename)
+        entryPath = self.__getFileEntryPath(filename)
+        found = entryPath is not None and os.path.exists(entryPath[0])
+        self.__count(found)
+        return found
+
+    def __count(self, hit: bool):
+        if hit:
+            self.stats.hits += 1
         else:
-            path = self.__getFilePath(filename)
-        return os.path.exists(path)
+            self.stats.misses += 1
 
 
 if __name__ == '__main__':
@@ -63,27 +63,6 @@ class Component:
         self.vueImports = set()
         self.mainImports = set()
 
-    def _traverseFromNode(self, node: nodes.Node):
-        # TODO Find a better way to traverse node's children
-        for key, val in vars(node).items():
-            if key in {"data", "type"}:
-                continue
-
-            if isinstance(val, int):
-                indexes = [val]
-            elif isinstance(val, list):
-                indexes = val
-            else:
-                continue
-            for index in indexes:
-                try:
-                    subNode = self.ast.getNode(index)
-                    assert isinstance(subNode, nodes.Node)
-                    yield node, subNode  # Parent, child
-                    yield from self._traverseFromNode(subNode)
-                except IndexError:
-                    pass  # Maybe a bad index?
-
     def mapFunctions(self, node: nodes.Node, isRenderMethod: bool,
                      isInsideRenderMethod: bool = False):
         """
@@ -102,7 +81,7 @@ class Component:
         # if self.extractName() == "AdminMarkdownModule":
         #     pass
 
-        for parent, identifier in self._traverseFromNode(node):
+        for parent, identifier in self.sourceFile.walker.walk(node):
             if identifier.type is JSNode.Identifier:
                 assert isinstance(identifier, nodes.Identifier)
                 if isRenderMethod and identifier.name in argMap:
@@ -141,17 +120,7 @@ class Component:
         #     print("MAIN:", self.mainImports)
 
     def findAllImports(self) -> list[nodes.Node]:
-        allImports = []
-
-        for node in self.ast.getAllNodes():
-            assert isinstance(node, nodes.Node)
-            if node.type != JSNode.ImportDeclaration:
-                continue
-            assert isinstance(node, nodes.ImportDeclaration)
-
-            allImports.append(node)
-
-        return allImports
+        return list(self.sourceFile.symbols.imports)
 
     def mapComponents(self, components: nodes.ASTNode) -> list[str]:
         """Maps the component list dict inside the component definition to their names,
@@ -191,17 +160,22 @@ class Component:
         return imports
 
     def decompile(self, target: Files):
-        from vuedec.TemplateParser import TemplateParser
-
         if target.has(f"{self.extractName()}.vue"):
             raise RuntimeError(f"Component '{self.extractName()}' already decompiled")
 
-        output = _TEMPLATE
+        target.set(f"{self.extractName()}.vue", self.render())
 
-        if self.definition:
-            self.mapFunctions(self.definition, False)
-        if self.renderMethod:
-            self.mapFunctions(self.renderMethod, True)
+    def render(self) -> str:
+        """Decompiles the component into the .vue file content without writing it anywhere."""
+        from vuedec.TemplateParser import TemplateParser
+
+        instrumentation = self.sourceFile.instrumentation
+        fileName, name = self.sourceFile.file_name, self.extractName()
+        with instrumentation.phase("map-functions", fileName, name):
+            if self.definition:
+                self.mapFunctions(self.definition, False)
+            if self.renderMethod:
+                self.mapFunctions(self.renderMethod, True)
 
         try:
             componentImports = self.mapComponents(self.definition.getByKey("components", self.ast))
@@ -219,25 +193,26 @@ class Component:
 
         imports.append(f"/*Original imports, might help you find the"
                        f" needed variables that are  being imported*/{NL}/*")
-        imports.extend(map(lambda x: x.toString(self.ast), self.findAllImports()))
+        imports.extend(self.sourceFile.importStrings())
         imports.append("*/")
 
-        output = output.replace("{IMPORTS}", NL.join(imports))
-
         if self.definition:
-            output = output.replace("{DEFINITION}", self.definition.toString(self.ast))
+            definition = self.definition.toString(self.ast)
         else:
-            output = output.replace("{DEFINITION}", "/*<NO DEFINITION>*/")
+            definition = "/*<NO DEFINITION>*/"
 
         if self.renderMethod:
-            templateParser = TemplateParser(self)
-            output = output.replace("{TEMPLATE}", templateParser.parse(self.renderMethod))
+            with instrumentation.phase("template", fileName, name) as phase:
+                templateParser = TemplateParser(self)
+                template = templateParser.parse(self.renderMethod)
+                phase.bytes = len(template)
         else:
             # TODO Extract the render method from setup()
-            output = output.replace("{TEMPLATE}",
-                                    "<NO RENDER METHOD, see SETUP's return for it maybe?>")
+            template = "<NO RENDER METHOD, see SETUP's return for it maybe?>"
 
-        target.set(f"{self.extractName()}.vue", output)
+        # Filled in a single pass, the parts are never searched for the other placeholders
+        return _TEMPLATE.format(TEMPLATE=template, IMPORTS=NL.join(imports),
+                                DEFINITION=definition)
 
     def extractName(self) -> str:
         if self.componentName is not None:
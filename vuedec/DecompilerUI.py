@@ -1,10 +1,22 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import json
+import sys
+import time
 from abc import abstractmethod, ABC
+from typing import TextIO
+
+# Event name --> its arguments, recorded by RecordingUI
+TEvent = tuple[str, tuple]
 
 
 class DecompilerUI(ABC):
+    """
+    Asks the user and reports the progress of a run. The progress events do nothing by default
+    and are cheap enough to be sent for every component.
+    """
+
     @abstractmethod
     def ask(self, question: str) -> str:
         raise NotImplementedError("You need to use subclass of DecompilerUI")
@@ -17,8 +29,134 @@ class DecompilerUI(ABC):
     def confirm(self, question: str, default: bool = True) -> bool:
         raise NotImplementedError("You need to use subclass of DecompilerUI")
 
+    def runStarted(self, fileCount: int):
+        """fileCount chunk files are going to be decompiled."""
+
+    def fileStarted(self, file_name: str):
+        pass
+
+    def bytesProcessed(self, file_name: str, phase: str, byteCount: int):
+        """The phase (beautify or parse) went through byteCount bytes of the file."""
+
+    def cacheAccess(self, cacheName: str, key: str, hit: bool):
+        pass
+
+    def componentEmitted(self, file_name: str, componentName: str, byteCount: int):
+        """The component was decompiled from the file into byteCount characters."""
+
+    def fileFinished(self, file_name: str, componentNames: list[str]):
+        pass
+
+    def runFinished(self, cacheStats: dict[str, dict]):
+        """cacheStats are the stats of every cache by its name, see Cache.allStats."""
+
+    def message(self, text: str):
+        pass
+
 
 class CmdUI(DecompilerUI):
+    """
+    Asks on the command line and shows the progress on a single line, rewritten in place with
+    the finished files, their rate and the estimated remaining time. When the output isn't
+    a terminal, a line is printed for every finished file instead.
+    """
+    fileCount: int
+    finishedCount: int
+    componentCount: int
+    byteCount: int
+    cacheHits: int
+    cacheMisses: int
+    currentFile: str
+    started: float
+    __lastRender: float
+    __lineLength: int
+
+    def __init__(self):
+        self.runStarted(0)
+
+    def runStarted(self, fileCount: int):
+        self.fileCount = fileCount
+        self.finishedCount = 0
+        self.componentCount = 0
+        self.byteCount = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.currentFile = ""
+        self.started = time.monotonic()
+        self.__lastRender = 0.0
+        self.__lineLength = 0
+
+    def fileStarted(self, file_name: str):
+        self.currentFile = file_name
+        self.__render()
+
+    def bytesProcessed(self, file_name: str, phase: str, byteCount: int):
+        if phase == "parse":
+            self.byteCount += byteCount
+
+    def cacheAccess(self, cacheName: str, key: str, hit: bool):
+        if hit:
+            self.cacheHits += 1
+        else:
+            self.cacheMisses += 1
+
+    def componentEmitted(self, file_name: str, componentName: str, byteCount: int):
+        self.componentCount += 1
+        self.__render()
+
+    def fileFinished(self, file_name: str, componentNames: list[str]):
+        self.finishedCount += 1
+        if self.__isTerminal():
+            self.__render(force=True)
+        else:
+            print(f"{self.__progress()} Decompiled {file_name}"
+                  f" (components: {', '.join(componentNames)})")
+
+    def runFinished(self, cacheStats: dict[str, dict]):
+        if self.__isTerminal() and self.__lineLength > 0:
+            print()
+            self.__lineLength = 0
+        seconds = time.monotonic() - self.started
+        print(f"Decompiled {self.finishedCount} files ({self.componentCount} components) in"
+              f" {seconds:.1f}s, cache hits: {self.cacheHits}, misses: {self.cacheMisses}")
+        for name, stats in cacheStats.items():
+            print(f"  {name}: {stats['hits']} hits, {stats['misses']} misses,"
+                  f" {stats['bytesRead'] / 2 ** 20:.2f} MB read,"
+                  f" {stats['bytesWritten'] / 2 ** 20:.2f} MB written, {stats['saves']} saves,"
+                  f" {stats['jsonSeconds']:.3f}s in JSON")
+
+    def message(self, text: str):
+        if self.__isTerminal() and self.__lineLength > 0:
+            # Above the progress line, which is rendered again by the next event
+            sys.stdout.write("\r" + " " * self.__lineLength + "\r")
+            self.__lineLength = 0
+        print(text)
+
+    @staticmethod
+    def __isTerminal() -> bool:
+        return sys.stdout.isatty()
+
+    def __progress(self) -> str:
+        seconds = max(time.monotonic() - self.started, 1e-9)
+        rate = self.finishedCount / seconds
+        progress = (f"[{self.finishedCount}/{self.fileCount}] {rate:.2f} files/s,"
+                    f" {self.byteCount / seconds / 2 ** 20:.2f} MB/s")
+        if 0 < self.finishedCount < self.fileCount:
+            remaining = (self.fileCount - self.finishedCount) / rate
+            progress += f", ETA {int(remaining) // 60}:{int(remaining) % 60:02d}"
+        return progress
+
+    def __render(self, force: bool = False):
+        now = time.monotonic()
+        # Rendering for every event would cost more than the events themselves
+        if (not force and now - self.__lastRender < 0.1) or not self.__isTerminal():
+            return
+        self.__lastRender = now
+        line = f"{self.__progress()}, {self.componentCount} components - {self.currentFile}"
+        sys.stdout.write("\r" + line.ljust(self.__lineLength))
+        sys.stdout.flush()
+        self.__lineLength = len(line)
+
     def ask(self, question: str) -> str:
         return input(question)
 
@@ -43,3 +181,109 @@ class CmdUI(DecompilerUI):
         else:
             print(f"Invalid answer '{answer}', y/n required")
             return self.confirm(question, default)
+
+
+class JSONLinesUI(DecompilerUI):
+    """
+    For headless runs, writes every progress event as a JSON object on its own line, e.g.
+    {"event": "fileFinished", "time": 1700000000.0, "file": "Chunk.js", "components": [...]}.
+    It can't ask, the questions raise a RuntimeError and confirm takes the default.
+    """
+    stream: TextIO | None  # None is the current stdout
+
+    def __init__(self, stream: TextIO | None = None):
+        self.stream = stream
+
+    def __write(self, event: str, flush: bool, **fields):
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps({"event": event, "time": time.time(), **fields}) + "\n")
+        if flush:
+            stream.flush()
+
+    def ask(self, question: str) -> str:
+        raise RuntimeError(f"Can't ask in a headless run: {question}")
+
+    def askMultiline(self, question: str) -> str:
+        raise RuntimeError(f"Can't ask in a headless run: {question}")
+
+    def confirm(self, question: str, default: bool = True) -> bool:
+        return default
+
+    def runStarted(self, fileCount: int):
+        self.__write("runStarted", True, files=fileCount)
+
+    def fileStarted(self, file_name: str):
+        self.__write("fileStarted", False, file=file_name)
+
+    def bytesProcessed(self, file_name: str, phase: str, byteCount: int):
+        self.__write("bytesProcessed", False, file=file_name, phase=phase, bytes=byteCount)
+
+    def cacheAccess(self, cacheName: str, key: str, hit: bool):
+        self.__write("cacheAccess", False, cache=cacheName, key=key, hit=hit)
+
+    def componentEmitted(self, file_name: str, componentName: str, byteCount: int):
+        self.__write("componentEmitted", False, file=file_name, component=componentName,
+                     bytes=byteCount)
+
+    def fileFinished(self, file_name: str, componentNames: list[str]):
+        self.__write("fileFinished", True, file=file_name, components=componentNames)
+
+    def runFinished(self, cacheStats: dict[str, dict]):
+        self.__write("runFinished", True, caches=cacheStats)
+
+    def message(self, text: str):
+        self.__write("message", True, text=text)
+
+
+class RecordingUI(DecompilerUI):
+    """
+    Records the progress events of a worker process, so that the parent can replay them
+    on its own UI. A worker can't ask, the questions raise a RuntimeError.
+    """
+    events: list[TEvent]
+
+    def __init__(self):
+        self.events = []
+
+    def takeEvents(self) -> list[TEvent]:
+        """The events recorded since the last call, which are then forgotten."""
+        events, self.events = self.events, []
+        return events
+
+    @staticmethod
+    def replay(events: list[TEvent], ui: DecompilerUI):
+        for name, arguments in events:
+            getattr(ui, name)(*arguments)
+
+    def ask(self, question: str) -> str:
+        raise RuntimeError(f"Can't ask in a worker process: {question}")
+
+    def askMultiline(self, question: str) -> str:
+        raise RuntimeError(f"Can't ask in a worker process: {question}")
+
+    def confirm(self, question: str, default: bool = True) -> bool:
+        raise RuntimeError(f"Can't ask in a worker process: {question}")
+
+    def runStarted(self, fileCount: int):
+        self.events.append(("runStarted", (fileCount,)))
+
+    def fileStarted(self, file_name: str):
+        self.events.append(("fileStarted", (file_name,)))
+
+    def bytesProcessed(self, file_name: str, phase: str, byteCount: int):
+        self.events.append(("bytesProcessed", (file_name, phase, byteCount)))
+
+    def cacheAccess(self, cacheName: str, key: str, hit: bool):
+        self.events.append(("cacheAccess", (cacheName, key, hit)))
+
+    def componentEmitted(self, file_name: str, componentName: str, byteCount: int):
+        self.events.append(("componentEmitted", (file_name, componentName, byteCount)))
+
+    def fileFinished(self, file_name: str, componentNames: list[str]):
+        self.events.append(("fileFinished", (file_name, componentNames)))
+
+    def runFinished(self, cacheStats: dict[str, dict]):
+        self.events.append(("runFinished", (cacheStats,)))
+
+    def message(self, text: str):
+        self.events.append(("message", (text,)))
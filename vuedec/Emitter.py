@@ -0,0 +1,71 @@
+#  -*- coding: utf-8 -*-
+__author__ = "kubik.augustyn@post.cz"
+
+from kutil import NL
+
+__all__ = ["Emitter"]
+
+
+class Emitter:
+    """
+    Collects the output as a flat list of fragments, joined only once by getValue, instead of
+    concatenating strings at every nesting level. Running totals of the fragments' lengths,
+    line breaks and non-blank fragments tell the length, line breaks and blankness of anything
+    emitted since a mark() without joining it.
+    """
+    parts: list[str]
+    __lengths: list[int]  # __lengths[i] is the total length of parts[:i]
+    __newlines: list[int]  # __newlines[i] is the number of line breaks in parts[:i]
+    __nonBlanks: list[int]  # __nonBlanks[i] is the number of non-blank parts in parts[:i]
+
+    def __init__(self):
+        self.parts = []
+        self.__lengths = [0]
+        self.__newlines = [0]
+        self.__nonBlanks = [0]
+
+    def emit(self, text: str):
+        if not text:
+            return
+        self.parts.append(text)
+        self.__lengths.append(self.__lengths[-1] + len(text))
+        self.__newlines.append(self.__newlines[-1] + text.count(NL))
+        self.__nonBlanks.append(self.__nonBlanks[-1] + (not text.isspace()))
+
+    def mark(self) -> int:
+        """The position of the next emitted fragment."""
+        return len(self.parts)
+
+    def truncate(self, mark: int):
+        """Throws away everything emitted since the mark."""
+        del self.parts[mark:]
+        del self.__lengths[mark + 1:]
+        del self.__newlines[mark + 1:]
+        del self.__nonBlanks[mark + 1:]
+
+    def length(self, mark: int) -> int:
+        return self.__lengths[-1] - self.__lengths[mark]
+
+    def hasNewline(self, mark: int) -> bool:
+        return self.__newlines[-1] != self.__newlines[mark]
+
+    def isBlank(self, mark: int) -> bool:
+        return self.__nonBlanks[-1] == self.__nonBlanks[mark]
+
+    def text(self, mark: int) -> str:
+        return "".join(self.parts[mark:])
+
+    def removeSuffix(self, suffix: str, mark: int):
+        """Removes the suffix from the end of the text emitted since the mark, if it ends with it."""
+        tail = ""
+        start = len(self.parts)
+        while start > mark and len(tail) < len(suffix):
+            start -= 1
+            tail = self.parts[start] + tail
+        if not tail.endswith(suffix):
+            return
+        self.truncate(start)
+        self.emit(tail[:-len(suffix)])
+
+    def getValue(self) -> str:
+        return "".join(self.parts)
@@ -1,37 +1,76 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import mmap
 import os.path
+from collections import OrderedDict
 
 
 class Files:
+    """
+    Reads and writes files within a directory. Reads go through mmap; only the most recently
+    read files up to maxCachedBytes are kept in memory, written files are never kept.
+    """
+    maxCachedBytes: int = 32 * 1024 * 1024
+
     path: str
-    __cache: dict[str, bytes]
+    __cache: OrderedDict[str, bytes]
+    __cachedBytes: int
 
     def __init__(self, path: str):
         super().__init__()
         self.path = path
-        self.__cache = {}
+        self.__cache = OrderedDict()
+        self.__cachedBytes = 0
 
     def has(self, file_name: str) -> bool:
         return os.path.exists(os.path.join(self.path, file_name))
 
-    def getRaw(self, file_name: str) -> bytes:
+    def getView(self, file_name: str) -> memoryview:
+        """A zero-copy, read-only view of the file's content, backed by mmap."""
         if file_name in self.__cache:
-            return self.__cache.get(file_name)
+            self.__cache.move_to_end(file_name)
+            return memoryview(self.__cache[file_name])
         if not self.has(file_name):
             raise AttributeError("404 File not found")
         path = os.path.join(self.path, file_name)
-        with open(path, "rb+") as f:
-            file = f.read()
-        self.__cache[file_name] = file
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:  # Empty files cannot be mapped
+                return memoryview(b"")
+            # The mapping outlives the file object and is unmapped once the view is released
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def getRaw(self, file_name: str) -> bytes:
+        if file_name in self.__cache:
+            self.__cache.move_to_end(file_name)
+            return self.__cache[file_name]
+        with self.getView(file_name) as view:
+            file = view.tobytes()
+        self.__remember(file_name, file)
         return file
 
     def get(self, file_name: str) -> str:
-        return self.getRaw(file_name).decode("utf-8")
+        if file_name in self.__cache:
+            return self.getRaw(file_name).decode("utf-8")
+        # Decode straight from the mapping, without an intermediate bytes copy
+        with self.getView(file_name) as view:
+            return str(view, "utf-8")
+
+    def __remember(self, file_name: str, file: bytes):
+        if len(file) > self.maxCachedBytes:
+            return
+        self.__cache[file_name] = file
+        self.__cachedBytes += len(file)
+        while self.__cachedBytes > self.maxCachedBytes:
+            _, evicted = self.__cache.popitem(last=False)
+            self.__cachedBytes -= len(evicted)
+
+    def __forget(self, file_name: str):
+        if file_name in self.__cache:
+            self.__cachedBytes -= len(self.__cache.pop(file_name))
 
     def setRaw(self, file_name: str, data: bytes):
-        self.__cache[file_name] = data
+        self.__forget(file_name)
         path = os.path.join(self.path, file_name)
         with open(path, "wb+") as f:
             f.write(data)
@@ -39,6 +78,11 @@ class Files:
     def set(self, file_name: str, data: str):
         self.setRaw(file_name, data.encode("utf-8"))
 
+    def delete(self, file_name: str):
+        self.__forget(file_name)
+        if self.has(file_name):
+            os.remove(os.path.join(self.path, file_name))
+
 
 if __name__ == '__main__':
     files = Files("")
@@ -0,0 +1,147 @@
+#  -*- coding: utf-8 -*-
+__author__ = "kubik.augustyn@post.cz"
+
+import csv
+import json
+import time
+
+__all__ = ["Instrumentation", "NullInstrumentation", "PHASES", "TRecords"]
+
+# The measured phases in the order they run, none of them is measured within another one
+PHASES: list[str] = ["hash", "beautify", "parse", "fn-map", "discovery", "map-functions",
+                     "template", "write"]
+
+# (phase, chunk file name, component name) --> [seconds, bytes, count]
+TRecords = dict[tuple[str, str, str], list]
+
+
+class _Timer:
+    """Measures one phase run, the bytes it processed can be set within the with block."""
+    __slots__ = ("instrumentation", "phase", "chunk", "component", "bytes", "start")
+
+    def __init__(self, instrumentation: "Instrumentation", phase: str, chunk: str,
+                 component: str, byteCount: int):
+        self.instrumentation = instrumentation
+        self.phase = phase
+        self.chunk = chunk
+        self.component = component
+        self.bytes = byteCount
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.add(self.phase, self.chunk, self.component,
+                                 time.perf_counter() - self.start, self.bytes)
+
+
+class _NullTimer:
+    """Shared by all the phases when the instrumentation is disabled, the bytes are ignored."""
+    __slots__ = ("bytes",)
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """
+    Records the time, processed bytes and run count of the decompiling phases per chunk file
+    and per component. Worker processes hand their records over to the parent by takeRecords,
+    which adds them by merge.
+    """
+    enabled: bool = True
+    records: TRecords
+    started: float
+
+    def __init__(self):
+        self.records = {}
+        self.started = time.perf_counter()
+
+    def phase(self, phase: str, chunk: str = "", component: str = "", byteCount: int = 0):
+        """A context manager measuring the with block as a run of the phase."""
+        return _Timer(self, phase, chunk, component, byteCount)
+
+    def add(self, phase: str, chunk: str = "", component: str = "", seconds: float = 0.0,
+            byteCount: int = 0, count: int = 1):
+        record = self.records.get((phase, chunk, component))
+        if record is None:
+            self.records[(phase, chunk, component)] = [seconds, byteCount, count]
+        else:
+            record[0] += seconds
+            record[1] += byteCount
+            record[2] += count
+
+    def takeRecords(self) -> TRecords:
+        """The records made since the last call, which are then forgotten."""
+        records, self.records = self.records, {}
+        return records
+
+    def merge(self, records: TRecords):
+        for (phase, chunk, component), (seconds, byteCount, count) in records.items():
+            self.add(phase, chunk, component, seconds, byteCount, count)
+
+    def rows(self) -> list[dict]:
+        """The records as dicts, ordered by the phase, chunk and component."""
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        keys = sorted(self.records, key=lambda key: (order.get(key[0], len(order)), key[1:]))
+        return [{"phase": phase, "chunk": chunk, "component": component,
+                 "seconds": self.records[phase, chunk, component][0],
+                 "bytes": self.records[phase, chunk, component][1],
+                 "count": self.records[phase, chunk, component][2]}
+                for phase, chunk, component in keys]
+
+    def phaseTotals(self) -> dict[str, dict]:
+        """Phase --> its seconds, bytes and count summed over all the chunks."""
+        totals = {}
+        for row in self.rows():
+            total = totals.setdefault(row["phase"], {"seconds": 0.0, "bytes": 0, "count": 0})
+            for field in ("seconds", "bytes", "count"):
+                total[field] += row[field]
+        return totals
+
+    def chunkTotals(self) -> dict[str, float]:
+        """Chunk file name --> seconds spent on it in all the phases, the slowest first."""
+        totals: dict[str, float] = {}
+        for (_, chunk, _), (seconds, _, _) in self.records.items():
+            if chunk:
+                totals[chunk] = totals.get(chunk, 0.0) + seconds
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def report(self) -> dict:
+        return {
+            "wall": time.perf_counter() - self.started,
+            "phases": self.phaseTotals(),
+            "chunks": self.chunkTotals(),
+            "records": self.rows()
+        }
+
+    def writeReport(self, path: str):
+        """Writes the report as JSON, or only its records as CSV when the path ends with .csv."""
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if path.lower().endswith(".csv"):
+                writer = csv.DictWriter(f, ["phase", "chunk", "component", "seconds", "bytes",
+                                            "count"])
+                writer.writeheader()
+                writer.writerows(self.rows())
+            else:
+                json.dump(self.report(), f, indent=2)
+
+
+class NullInstrumentation(Instrumentation):
+    """Used when the instrumentation is disabled, records nothing."""
+    enabled: bool = False
+
+    def phase(self, phase: str, chunk: str = "", component: str = "", byteCount: int = 0):
+        return _NULL_TIMER
+
+    def add(self, phase: str, chunk: str = "", component: str = "", seconds: float = 0.0,
+            byteCount: int = 0, count: int = 1):
+        pass
@@ -1,8 +1,15 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import functools
+import hashlib
+import importlib.metadata
+import multiprocessing.pool
 import os
+import pickle
 import re
+import sys
+import time
 import zlib
 
 from kutil.language.AST import AST
@@ -15,10 +22,50 @@ from vuedec.types import TComponent
 from vuedec.DecompilerUI import DecompilerUI
 from vuedec.Cache import Cache  # In future from kutil.storage.Cache import Cache
 from vuedec.Files import Files
+from vuedec.SymbolTable import SymbolTable
+from vuedec.ASTWalker import ASTWalker
+from vuedec.Instrumentation import Instrumentation, NullInstrumentation
 import jsbeautifier
 
 import kutil.language.languages.javascript.JSParser
 
+# Files modified less than this (nanoseconds) ago might still change within the same mtime,
+# so their stat isn't trusted for skipping the hashing
+_RACY_MTIME_NS = 2_000_000_000
+
+
+@functools.cache
+def _astFingerprint() -> str:
+    """Identifies everything the pickled AST depends on, so that the AST cache invalidates
+    itself when kutil, jsbeautifier, vuedec or Python change."""
+    import vuedec
+
+    parts = [sys.version.split()[0], vuedec.__version__, jsbeautifier.__version__]
+    try:
+        parts.append(importlib.metadata.version("kutil"))
+    except importlib.metadata.PackageNotFoundError:
+        # kutil isn't installed from a distribution, fall back to its parser sources
+        jsPackage = os.path.dirname(kutil.language.languages.javascript.JSParser.__file__)
+        for file_name in sorted(os.listdir(jsPackage)):
+            if not file_name.endswith(".py"):
+                continue
+            stat = os.stat(os.path.join(jsPackage, file_name))
+            parts.append(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "%08X" % zlib.crc32("|".join(parts).encode("utf-8"))
+
+
+def _beautifySource(content: str) -> str:
+    return jsbeautifier.beautify(content).replace("\r\n", "\n")
+
+
+def _beautifyFile(task: tuple[str, str]) -> tuple[str, str, int, float]:
+    """Returns the file name, the beautified content, the source length and the seconds taken."""
+    path, file_name = task
+    source = Files(path).get(file_name)
+    start = time.perf_counter()
+    content = _beautifySource(source)
+    return file_name, content, len(source), time.perf_counter() - start
+
 
 class JSParser:
     files: Files
@@ -27,32 +74,80 @@ class JSParser:
     cache: Cache
     ast: AST | None
     entryPoint: Module | None
+    beautify: bool
+    instrumentation: Instrumentation
+    __hash: str | None
+    __symbols: SymbolTable | None
+    __walker: ASTWalker | None
 
     componentMap: dict[str, tuple[TComponent, nodes.VariableDeclarator, str]]
+    __componentOrder: dict[str, int]  # Component name --> registration number
+    __registrationCount: int
+    __componentByVarName: dict[str, str]  # Var name --> component name
+    __importStrings: dict[int, str]  # Import declaration position --> its code
+    # Rendered hoisted vnodes and the hoisted var names with mapped function names,
+    # shared by the file's components, see TemplateParser.parseTemplate
+    hoistedTemplates: dict[tuple, str]
+    mappedHoists: set[str]
 
     def __init__(self, files: Files, file_name: str, ui: DecompilerUI, cache_path: str,
-                 immediately_parse=True):
+                 immediately_parse=True, beautify=True,
+                 instrumentation: Instrumentation | None = None):
+        """
+        With beautify unset, the original (minified) source is parsed directly,
+        the beautified source is then only made on demand by getBeautified.
+        The instrumentation records the phases of processing the file, disabled by default.
+        """
         self.files = files
         self.file_name = file_name
         self.ui = ui
         self.cache = Cache("js-parser", cache_path)
         self.ast = None
         self.entryPoint = None
+        self.beautify = beautify
+        self.instrumentation = instrumentation or NullInstrumentation()
+        self.__hash = None
+        self.__symbols = None
+        self.__walker = None
 
         self.componentMap = {}
+        self.__componentOrder = {}
+        self.__registrationCount = 0
+        self.__componentByVarName = {}
+        self.__importStrings = {}
+        self.hoistedTemplates = {}
+        self.mappedHoists = set()
 
         if immediately_parse:
             self.parse()
 
-    def __crc32(self):
-        with open(os.path.join(self.files.path, self.file_name), 'rb') as f:
-            hash = 0
-            while True:
-                chunk = f.read(65536)
-                if not chunk:
-                    break
-                hash = zlib.crc32(chunk, hash)
-            return "%08X" % (hash & 0xFFFFFFFF)
+    def contentHash(self) -> str:
+        """
+        The hash of the source file's content, computed only once per instance. When the file's
+        size, mtime and inode match the ones cached along with its hash, the file isn't read.
+        """
+        if self.__hash is not None:
+            return self.__hash
+
+        stat = os.stat(os.path.join(self.files.path, self.file_name))
+        fileStat = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        cached = self.cache.get(f"stat-{self.file_name}")
+        if cached is not None and cached["stat"] == fileStat:
+            self.__hash = cached["hash"]
+            return self.__hash
+
+        # Hash the mapped file in place, without copying it into memory
+        with (self.instrumentation.phase("hash", self.file_name, byteCount=stat.st_size),
+              self.files.getView(self.file_name) as view):
+            self.__hash = hashlib.blake2b(view, digest_size=20).hexdigest()
+        if time.time_ns() - stat.st_mtime_ns > _RACY_MTIME_NS:
+            self.cache.set(f"stat-{self.file_name}", {"stat": fileStat, "hash": self.__hash})
+        return self.__hash
+
+    def cacheKeys(self) -> set[str]:
+        """The js-parser cache keys used by the file in its current version."""
+        return {f"stat-{self.file_name}", f"hash-{self.file_name}",
+                f"beautified-{self.file_name}", self.__astCacheKey(self.contentHash())}
 
     def __getLines(self, lines, fromLine, toLine):
         if fromLine == toLine:
@@ -60,73 +155,161 @@ class JSParser:
             return [lines[fromLine - 1]]
         return lines[fromLine - 1:toLine]
 
-    def __beautify(self) -> str:
-        if self.cache.hasFile(f"beautified-{self.file_name}"):
-            content = self.cache.getFile(f"beautified-{self.file_name}")
-        else:
-            content = self.files.get(self.file_name)
-            print(f"Applying beautifier to {self.file_name}", end="")
-            content = jsbeautifier.beautify(content)
-            content = content.replace("\r\n", "\n")
+    def __hasBeautified(self, hash: str) -> bool:
+        # The beautified file is only valid for the content it was made from
+        return (hash == self.cache.get(f"hash-{self.file_name}") and
+                self.cache.hasFile(f"beautified-{self.file_name}"))
+
+    def __storeBeautified(self, hash: str, content: str):
+        with self.cache.batch():
             self.cache.setFile(f"beautified-{self.file_name}", content)
-            print(" - DONE")
+            self.cache.set(f"hash-{self.file_name}", hash)
+
+    def __beautify(self, hash: str) -> str:
+        hit = self.__hasBeautified(hash)
+        self.ui.cacheAccess(self.cache.name, f"beautified-{self.file_name}", hit)
+        if hit:
+            return self.cache.getFile(f"beautified-{self.file_name}")
+
+        content = self.files.get(self.file_name)
+        with self.instrumentation.phase("beautify", self.file_name, byteCount=len(content)):
+            beautified = _beautifySource(content)
+        self.__storeBeautified(hash, beautified)
+        self.ui.bytesProcessed(self.file_name, "beautify", len(content))
 
-        return content
+        return beautified
+
+    def getBeautified(self) -> str:
+        """The beautified source, for output or debugging."""
+        return self.__beautify(self.contentHash())
+
+    def needsBeautifying(self) -> bool:
+        """Whether parsing the file would have to run the beautifier first."""
+        if not self.beautify:
+            return False
+        hash = self.contentHash()
+        return not self.cache.hasFile(self.__astCacheKey(hash)) and not self.__hasBeautified(hash)
+
+    @staticmethod
+    def prebeautify(parsers: list["JSParser"], pool: multiprocessing.pool.Pool) -> int:
+        """
+        Beautifies all the files that need it in the pool's worker processes at once and stores
+        the results in the cache, so that parsing them doesn't wait for the beautifier.
+        Returns the number of beautified files.
+        """
+        stale = {parser.file_name: parser for parser in parsers if parser.needsBeautifying()}
+        tasks = [(parser.files.path, parser.file_name) for parser in stale.values()]
+        for file_name, content, sourceLength, seconds in pool.imap_unordered(_beautifyFile, tasks):
+            parser = stale[file_name]
+            parser.instrumentation.add("beautify", file_name, seconds=seconds,
+                                       byteCount=sourceLength)
+            parser.__storeBeautified(parser.contentHash(), content)
+            parser.ui.bytesProcessed(file_name, "beautify", sourceLength)
+        return len(stale)
 
     def parse(self) -> tuple[AST, nodes.Module]:
         if self.ast is not None and self.entryPoint is not None:
             return self.ast, self.entryPoint
 
-        hash = self.__crc32()  # Cache beautifying
-        if hash != self.cache.get(f"hash-{self.file_name}"):
-            beautified_file = self.__beautify()
-            self.cache.set(f"hash-{self.file_name}", hash)
+        hash = self.contentHash()  # Cache beautifying and parsing
+        hit = self.__loadCachedAST(hash)
+        self.ui.cacheAccess(self.cache.name, self.__astCacheKey(hash), hit)
+        if hit:
+            return self.ast, self.entryPoint
+
+        if self.beautify:
+            source = self.__beautify(hash)
         else:
-            beautified_file = self.cache.getFile(f"beautified-{self.file_name}")
+            source = self.files.get(self.file_name)
         options: JSOptions = JSOptions()
-        print(f"Parsing {self.file_name}", end="")
-        self.ast, self.entryPoint = parseModule(beautified_file, options)
-        print(" - DONE")
+        with self.instrumentation.phase("parse", self.file_name, byteCount=len(source)):
+            self.ast, self.entryPoint = parseModule(source, options)
+        self.ui.bytesProcessed(self.file_name, "parse", len(source))
+        # Store it before anything (e.g. Component.mapFunctions) modifies the AST
+        self.cache.setFileRaw(self.__astCacheKey(hash),
+                              pickle.dumps((self.ast, self.entryPoint), pickle.HIGHEST_PROTOCOL))
         return self.ast, self.entryPoint
 
+    def __astCacheKey(self, hash: str) -> str:
+        # The beautified and the original source don't produce the same AST (e.g. the positions)
+        return f"ast-{hash}-{_astFingerprint()}{'' if self.beautify else '-raw'}"
+
+    def __loadCachedAST(self, hash: str) -> bool:
+        raw = self.cache.getFileRaw(self.__astCacheKey(hash))
+        if raw is None:
+            return False
+        try:
+            self.ast, self.entryPoint = pickle.loads(raw)
+        except Exception:  # A corrupted or incompatible entry, parse again
+            self.ast, self.entryPoint = None, None
+            return False
+        return True
+
+    @property
+    def walker(self) -> ASTWalker:
+        assert self.ast is not None, "Not parsed yet"
+        if self.__walker is None or self.__walker.ast is not self.ast:
+            self.__walker = ASTWalker(self.ast)
+        return self.__walker
+
+    @property
+    def symbols(self) -> SymbolTable:
+        """The module's top-level declarations, built on the first use after parsing."""
+        if self.__symbols is None:
+            assert self.ast is not None and self.entryPoint is not None, "Not parsed yet"
+            self.__symbols = SymbolTable(self.ast, self.ast.getNodes(self.entryPoint.body))
+        return self.__symbols
+
     def registerComponent(self, component: TComponent, name: str, varName: str,
                           varNode: nodes.VariableDeclarator):
+        if name in self.componentMap:
+            self.__forgetComponentVarName(name)
         self.componentMap[name] = (component, varNode, varName)
+        # Overwriting keeps the original position, like it does in componentMap
+        if name not in self.__componentOrder:
+            self.__componentOrder[name] = self.__registrationCount
+            self.__registrationCount += 1
+        self.__componentByVarName.setdefault(varName, name)
 
     def unregisterComponent(self, name: str):
+        self.__forgetComponentVarName(name)
         del self.componentMap[name]
+        del self.__componentOrder[name]
+
+    def __forgetComponentVarName(self, name: str):
+        varName = self.componentMap[name][2]
+        if self.__componentByVarName.get(varName) != name:
+            return
+        del self.__componentByVarName[varName]
+        # Another component of the same var name, registered later, takes its place
+        for otherName, (_, _, otherVarName) in self.componentMap.items():
+            if otherVarName == varName and otherName != name:
+                self.__componentByVarName[varName] = otherName
+                break
 
     def findComponentNameByVarName(self, varName: str, otherVarName: str | None = None) -> str:
-        for key, (_, _, cmpVarName) in self.componentMap.items():
-            if cmpVarName == varName:
-                return key
-            if otherVarName is not None and otherVarName == cmpVarName:
-                return key
-        raise KeyError("Component var name not found")
+        candidates = [self.__componentByVarName[name] for name in (varName, otherVarName)
+                      if name in self.__componentByVarName]
+        if len(candidates) == 0:
+            raise KeyError("Component var name not found")
+        # The first registered one, as if the registry was searched in order
+        return min(candidates, key=self.__componentOrder.__getitem__)
 
     def findComponentNameByImport(self, importedName: str, usedName: str) -> tuple[str, str]:
-        from vuedec.VueDecompiler import VueDecompiler
-
-        for node in self.ast.getNodes(self.entryPoint.body):
-            if node.type is not JSNode.ImportDeclaration:
-                continue
-            assert isinstance(node, nodes.ImportDeclaration)
-
-            sourceNode = self.ast.getNode(node.source)
-            assert isinstance(sourceNode, nodes.Literal)
-
-            # source = VueDecompiler.absPath(str(sourceNode.value))
-            # match = re.match(r"([A-Za-z]+)([\w\W]+)(.min)?(.js)?", source)
-            # source = match.group(1)
-
-            for specifier in self.ast.getNodes(node.specifiers):
-                assert isinstance(specifier, nodes.ImportSpecifier)
-
-                localNode = self.ast.getNode(specifier.local)
-                assert isinstance(localNode, nodes.Identifier)
+        candidates = [self.symbols.importsByLocalName[name] for name in (importedName, usedName)
+                      if name in self.symbols.importsByLocalName]
+        if len(candidates) == 0:
+            raise KeyError("Component var name not found")
+        # The first declaration importing either of the names
+        position, node = min(candidates, key=lambda candidate: candidate[0])
+        return usedName, self.importString(position)
 
-                if localNode.name != importedName and localNode.name != usedName:
-                    continue
+    def importStrings(self) -> list[str]:
+        """The code of all the import declarations, shared by all the file's components."""
+        return [self.importString(position) for position in range(len(self.symbols.imports))]
 
-                return usedName, node.toString(self.ast)
-        raise KeyError("Component var name not found")
+    def importString(self, position: int) -> str:
+        """The code of the position-th import declaration, rendered only once."""
+        if position not in self.__importStrings:
+            self.__importStrings[position] = self.symbols.imports[position].toString(self.ast)
+        return self.__importStrings[position]
@@ -0,0 +1,189 @@
+#  -*- coding: utf-8 -*-
+__author__ = "kubik.augustyn@post.cz"
+
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+__all__ = ["ChunkProfiler", "ChunkProfile"]
+
+# Collapsed stacks deeper than this are cut, the call graph of a recursive descent can be deep
+_MAX_STACK_DEPTH = 200
+
+
+@dataclass
+class ChunkProfile:
+    """The results of profiling a single chunk file."""
+    file_name: str
+    seconds: float
+    topFunctions: list[tuple[str, float]]  # (function, own seconds), the slowest first
+    peakMemory: int | None = None  # Bytes, when traced by tracemalloc
+    topAllocations: list[tuple[str, int]] = field(default_factory=list)  # (site, bytes)
+
+
+def _isProfilerFunction(function: tuple[str, int, str]) -> bool:
+    """Whether the function is a part of the profiling, rather than of the profiled code."""
+    return function[0] == __file__ or "_lsprof.Profiler" in function[2]
+
+
+def _functionLabel(function: tuple[str, int, str]) -> str:
+    file_name, line, name = function
+    if file_name == "~":  # Built-in
+        return name
+    return f"{os.path.basename(file_name)}:{line}({name})"
+
+
+def collapsedStacks(stats: pstats.Stats) -> list[str]:
+    """
+    The profile as collapsed stacks ("caller;callee;... microseconds" lines) for flame graph
+    tools. cProfile only knows the direct callers of each function, so a function's time
+    is split between the stacks leading to it in proportion to the time of each call edge.
+    """
+    callees: dict[tuple, list[tuple[tuple, float]]] = {}
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers and not _isProfilerFunction(function):
+            roots.append(function)
+        for caller, (_, _, _, edgeCumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, edgeCumulative))
+
+    weights: dict[str, float] = {}
+    # (function, the fraction of its time spent in this stack, the stack up to it)
+    stack: list[tuple[tuple, float, tuple[str, ...]]] = [(root, 1.0, ()) for root in roots]
+    while stack:
+        function, fraction, path = stack.pop()
+        _, _, own, cumulative, _ = stats.stats[function]
+        label = _functionLabel(function).replace(";", ",")
+        if label in path or len(path) >= _MAX_STACK_DEPTH or cumulative * fraction < 1e-6:
+            continue  # Recursion (its time is already counted by the outer call) or negligible
+        path += (label,)
+        key = ";".join(path)
+        weights[key] = weights.get(key, 0.0) + own * fraction
+        for callee, edgeCumulative in callees.get(function, ()):
+            calleeCumulative = stats.stats[callee][3]
+            if calleeCumulative > 0 and edgeCumulative > 0:
+                stack.append((callee, fraction * edgeCumulative / calleeCumulative, path))
+    return [f"{key} {round(weight * 1e6)}" for key, weight in sorted(weights.items())
+            if weight >= 1e-6]
+
+
+class ChunkProfiler:
+    """
+    Profiles the decompiling of each chunk file separately with cProfile, writing
+    <chunk>.pstats and <chunk>.collapsed (for flame graph tools) into the directory.
+    With traceMemory, the peak memory of each chunk is traced by tracemalloc too, along with
+    the allocation sites holding the most memory at its end.
+    Worker processes hand their results over to the parent by takeResults, which adds them
+    by merge.
+    """
+    directory: str
+    traceMemory: bool
+    top: int  # Functions and allocation sites kept per chunk
+    results: list[ChunkProfile]
+
+    def __init__(self, directory: str, traceMemory: bool = False, top: int = 5):
+        self.directory = directory
+        self.traceMemory = traceMemory
+        self.top = top
+        self.results = []
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def settings(self) -> tuple[str, bool, int]:
+        """The arguments making an equal profiler, e.g. in a worker process."""
+        return self.directory, self.traceMemory, self.top
+
+    def profile(self, file_name: str) -> "_ProfiledChunk":
+        """A context manager profiling the with block as the decompiling of the chunk file."""
+        return _ProfiledChunk(self, file_name)
+
+    def save(self, file_name: str, profile: cProfile.Profile, seconds: float,
+             snapshot: tracemalloc.Snapshot | None, peakMemory: int | None):
+        path = os.path.join(self.directory, file_name)
+        profile.dump_stats(f"{path}.pstats")
+        stats = pstats.Stats(profile)
+        with open(f"{path}.collapsed", "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in collapsedStacks(stats))
+
+        slowest = sorted((item for item in stats.stats.items() if not _isProfilerFunction(item[0])),
+                         key=lambda item: item[1][2], reverse=True)
+        topFunctions = [(_functionLabel(function), own)
+                        for function, (_, _, own, _, _) in slowest[:self.top]]
+        topAllocations = []
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, __file__),
+                                               tracemalloc.Filter(False, tracemalloc.__file__)])
+            topAllocations = [(str(statistic.traceback[0]), statistic.size)
+                              for statistic in snapshot.statistics("lineno")[:self.top]]
+        self.results.append(ChunkProfile(file_name, seconds, topFunctions, peakMemory,
+                                         topAllocations))
+
+    def takeResults(self) -> list[ChunkProfile]:
+        """The results made since the last call, which are then forgotten."""
+        results, self.results = self.results, []
+        return results
+
+    def merge(self, results: list[ChunkProfile]):
+        self.results.extend(results)
+
+    def summary(self, chunks: int = 10) -> str:
+        """The slowest chunks with their slowest functions (and allocation sites)."""
+        lines = [f"Slowest chunks (profiles in {self.directory}):"]
+        for result in sorted(self.results, key=lambda result: result.seconds,
+                             reverse=True)[:chunks]:
+            memory = "" if result.peakMemory is None \
+                else f", peak memory {result.peakMemory / 2 ** 20:.1f} MB"
+            lines.append(f"  {result.file_name}: {result.seconds:.3f}s{memory}")
+            for function, own in result.topFunctions:
+                lines.append(f"    {own:9.3f}s  {function}")
+            for site, size in result.topAllocations:
+                lines.append(f"    {size / 2 ** 20:8.1f}MB  {site}")
+        return "\n".join(lines)
+
+    def writeSummary(self) -> str:
+        """Writes the summary of all the chunks into summary.txt, returning its path."""
+        path = os.path.join(self.directory, "summary.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.summary(len(self.results)) + "\n")
+        return path
+
+
+class _ProfiledChunk:
+    """Profiles a with block for ChunkProfiler.profile."""
+    profiler: ChunkProfiler
+    file_name: str
+    profile: cProfile.Profile
+    startedTracing: bool
+    start: float
+
+    def __init__(self, profiler: ChunkProfiler, file_name: str):
+        self.profiler = profiler
+        self.file_name = file_name
+        self.profile = cProfile.Profile()
+        self.startedTracing = False
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.profiler.traceMemory:
+            # Traced from the start of the chunk, unless something else traces it already
+            self.startedTracing = not tracemalloc.is_tracing()
+            if self.startedTracing:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        self.profile.enable()
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        seconds = time.perf_counter() - self.start
+        snapshot = peakMemory = None
+        if self.profiler.traceMemory:
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            if self.startedTracing:
+                tracemalloc.stop()
+        self.profiler.save(self.file_name, self.profile, seconds, snapshot, peakMemory)
@@ -0,0 +1,90 @@
+#  -*- coding: utf-8 -*-
+__author__ = "kubik.augustyn@post.cz"
+
+from collections.abc import Mapping
+from typing import Iterator
+
+from kutil.language.AST import AST, ASTNode
+from kutil.language.languages.javascript import nodes
+from kutil.language.languages.javascript.syntax import JSNode
+
+__all__ = ["SymbolTable", "VarPool"]
+
+
+class VarPool(Mapping):
+    """
+    A read-only mapping of a module's top-level variable names to their init nodes (hoisted
+    vnodes, dynamic prop lists, ...). Unlike a mapping proxy, it can be pickled, so it can be
+    handed to worker processes.
+    """
+    __inits: dict[str, nodes.Node]
+
+    def __init__(self, inits: dict[str, nodes.Node]):
+        self.__inits = dict(inits)
+
+    def __getitem__(self, name: str) -> nodes.Node:
+        return self.__inits[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self.__inits
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__inits)
+
+    def __len__(self) -> int:
+        return len(self.__inits)
+
+
+class SymbolTable:
+    """
+    The top-level declarations of a module, collected in a single pass over its body,
+    so that they can be looked up by name instead of scanning the module every time.
+    """
+    declarators: list[tuple[str, nodes.VariableDeclarator]]  # In the source order
+    variables: dict[str, nodes.VariableDeclarator]  # The first declaration of each name
+    functions: dict[str, nodes.FunctionDeclaration]  # The first declaration of each name
+    inits: dict[str, nodes.Node]  # Variable name --> init node (the last declaration)
+    exports: list[nodes.ExportNamedDeclaration]
+    imports: list[nodes.ImportDeclaration]
+    # Imported local name --> (position in imports, declaration), the first import of each name
+    importsByLocalName: dict[str, tuple[int, nodes.ImportDeclaration]]
+    varPool: VarPool  # The inits, read-only
+
+    def __init__(self, ast: AST, moduleNodes: list[ASTNode]):
+        self.declarators = []
+        self.variables = {}
+        self.functions = {}
+        self.inits = {}
+        self.exports = []
+        self.imports = []
+        self.importsByLocalName = {}
+
+        for node in moduleNodes:
+            if node.type is JSNode.VariableDeclaration:
+                assert isinstance(node, nodes.VariableDeclaration)
+                for declarator in ast.getNodes(node.declarations):
+                    assert isinstance(declarator, nodes.VariableDeclarator)
+                    identifier = ast.getNode(declarator.id)
+                    if not isinstance(identifier, nodes.Identifier):
+                        continue  # Destructuring
+                    self.declarators.append((identifier.name, declarator))
+                    self.variables.setdefault(identifier.name, declarator)
+                    if declarator.init is not None:
+                        self.inits[identifier.name] = ast.getNode(declarator.init)
+            elif node.type is JSNode.FunctionDeclaration:
+                assert isinstance(node, nodes.FunctionDeclaration)
+                identifier = ast.getNode(node.id)
+                if isinstance(identifier, nodes.Identifier):
+                    self.functions.setdefault(identifier.name, node)
+            elif node.type is JSNode.ExportNamedDeclaration:
+                self.exports.append(node)
+            elif node.type is JSNode.ImportDeclaration:
+                assert isinstance(node, nodes.ImportDeclaration)
+                for specifier in ast.getNodes(node.specifiers):
+                    identifier = ast.getNode(specifier.local)
+                    if isinstance(identifier, nodes.Identifier):
+                        self.importsByLocalName.setdefault(identifier.name,
+                                                           (len(self.imports), node))
+                self.imports.append(node)
+
+        self.varPool = VarPool(self.inits)
@@ -2,7 +2,8 @@
 __author__ = "kubik.augustyn@post.cz"
 
 import json
-from typing import Any
+from collections.abc import Mapping
+from typing import Any, Callable, Iterator
 
 from kutil import NL
 from kutil.language.AST import AST
@@ -12,9 +13,10 @@ from kutil.language.languages.javascript.syntax import JSNode
 
 from vuedec import JSParser
 from vuedec.Component import Component
+from vuedec.Emitter import Emitter
 from vuedec.VueDecompiler import VueDecompiler
 
-__all__ = ["TemplateParser"]
+__all__ = ["TemplateParser", "THelperHandler", "TRenderSteps"]
 
 BASE_V_NODE_ARGS: list[str] = ["type", "props", "children", "patchFlag", "dynamicProps",
                                "shapeFlag", "unknown1", "unknown2"]
@@ -83,15 +85,24 @@ VOID_ELEMENTS: set[str] = {"area", "base", "br", "col", "embed", "hr", "img", "i
                            "meta", "param", "source", "track", "wbr"}
 
 
+# The steps of rendering a node: the (node, addAttributes) to render in place, see parseTemplate
+TRenderSteps = Iterator[tuple[nodes.Node, dict[str, Any] | None]]
+# (parser, node, addAttributes=...) --> None or its TRenderSteps, the rendered node is emitted
+# to parser.out
+THelperHandler = Callable[..., TRenderSteps | None]
+
+
 class TemplateParser:
     component: Component
     ast: AST
     sourceFile: JSParser
+    out: Emitter  # The template being rendered
 
-    varPool: dict[str, nodes.Node]
+    varPool: Mapping[str, nodes.Node]  # Shared by all the file's components, read-only
     usedComponentsPool: dict[str, str]  # varName --> component name
-    blockStack: list[list | None]
-    currentBlock: list | None
+    usedComponentsKey: frozenset[tuple[str, str]]  # The pool's items, to key the hoisted memo
+    blockStack: list[list[int] | None]
+    currentBlock: list[int] | None  # The marks of the rendered block children
     offsetCount: int
     ctxVForCount: int
 
@@ -99,8 +110,10 @@ class TemplateParser:
         self.component = component
         self.ast = component.ast
         self.sourceFile = component.sourceFile
+        self.out = Emitter()
 
         self.usedComponentsPool = {}
+        self.usedComponentsKey = frozenset()
         self.varPool = {}
         self.blockStack = []
         self.currentBlock = None
@@ -140,25 +153,8 @@ class TemplateParser:
         params.update(paramOverrides)
         return params
 
-    def extractVarPool(self) -> dict[str, nodes.Node]:
-        varPool = {}
-
-        for node in self.ast.getNodes(self.sourceFile.entryPoint.body):
-            if node.type is JSNode.VariableDeclaration:
-                assert isinstance(node, nodes.VariableDeclaration)
-                for declarator in self.ast.getNodes(node.declarations):
-                    assert isinstance(declarator, nodes.VariableDeclarator)
-                    varName = VueDecompiler.getIdentifierName(self.ast.getNode(declarator.id))
-
-                    initI: int | None = declarator.init
-                    if initI is None:
-                        continue
-
-                    init = self.ast.getNode(initI)
-                    assert isinstance(init, nodes.Node)
-
-                    varPool[varName] = init
-        return varPool
+    def extractVarPool(self) -> Mapping[str, nodes.Node]:
+        return self.sourceFile.symbols.varPool
 
     @property
     def offset(self) -> str:
@@ -187,11 +183,10 @@ class TemplateParser:
         else:
             self.currentBlock = self.blockStack[-1]
 
-    def setupBlock(self, thing: str) -> str:
+    def setupBlock(self, mark: int):
         self.closeBlock()
         if self.currentBlock is not None:
-            self.currentBlock.append(thing)
-        return thing
+            self.currentBlock.append(mark)
 
     @staticmethod
     def surroundString(inp: str) -> str:
@@ -257,15 +252,12 @@ class TemplateParser:
                 return self.parseMethodHandler(node), None
         return None, None
 
-    def parseSlots(self, node: nodes.ObjectExpression) -> str | None:
+    def parseSlots(self, node: nodes.ObjectExpression) -> TRenderSteps:
         # TODO Deal better with only the default slot
         # TODO Fix the offsets
         # <template v-slot:default /> - nope
         # <template #slotId /> - yes
-        slots: list[str] = []
-
-        defaultSlot: str | None = None
-
+        slots: list[tuple[str, nodes.Node]] = []
         for key, value in node.items(self.ast):
             if isinstance(key, nodes.Identifier):
                 slotName = key.name
@@ -277,25 +269,25 @@ class TemplateParser:
 
             if slotName == "_":
                 continue
-
-            if slotName == "default":
-                slotBodyWithoutOffset = self.parseTemplate(value)
-                defaultSlot = slotBodyWithoutOffset
-
-            self.tab()
-            slotBody = self.parseTemplate(value)
-            self.unTab()
-
-            slots.append(f"{self.offset}<template #{slotName}>{NL}{slotBody}{NL}{self.offset}</template>")
+            slots.append((slotName, value))
 
         if len(slots) == 0:
             raise ValueError("There must be at least 1 slot")
 
-        if len(slots) == 1 and defaultSlot is not None:
-            # assert defaultSlot is not None, "The only slot isn't the 'default' slot"
-            return defaultSlot
+        # The layout is known before rendering, so every slot is rendered only once
+        if len(slots) == 1 and slots[0][0] == "default":
+            # The only slot's content goes straight into the component
+            yield slots[0][1], None
+            return
 
-        return NL.join(slots)
+        for i, (slotName, value) in enumerate(slots):
+            if i > 0:
+                self.out.emit(NL)
+            self.out.emit(f"{self.offset}<template #{slotName}>{NL}")
+            self.tab()
+            yield value, None
+            self.unTab()
+            self.out.emit(f"{NL}{self.offset}</template>")
 
     @staticmethod
     def offsetStringBy(string: str, off: str) -> str:
@@ -346,7 +338,7 @@ class TemplateParser:
     # Vue method parsing
     def parseCreateBaseVNode(self, node: nodes.CallExpression,
                              paramOverrides: dict[str, Any] | None = None,
-                             addAttributes: dict[str, Any] | None = None) -> str:
+                             addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: type, props, children, patchFlag,
         # dynamicProps, shapeFlag, unknown1, unknown2
         if addAttributes is None:
@@ -363,7 +355,6 @@ class TemplateParser:
             BVARGS.DYNAMIC_PROPS]
 
         off: str = self.offset
-        children: str | None = None
 
         attributeList: list[str] = []
         for paramName, value in addAttributes.items():
@@ -398,55 +389,13 @@ class TemplateParser:
 
                 self.parseAttributeToString(keyStr, value, attributeList, dynProps)
 
-        attributeList = list(map(
-            lambda x: "".join(map(lambda line: line.strip(), x.split(NL))) if x.count(
-                NL) < 3 else x,
-            attributeList
-        ))
+        for i, attribute in enumerate(attributeList):
+            # Short multi-line values are put on a single line
+            if attribute.count(NL) < 3:
+                attributeList[i] = "".join(line.strip() for line in attribute.split(NL))
 
         attributes: str | None = (" " + " ".join(attributeList)) if len(attributeList) > 0 else ""
 
-        if childrenList is not None:
-            self.tab()
-            string = None
-
-            if isinstance(childrenList, nodes.Identifier):
-                childrenVarValue = self.varPool[VueDecompiler.getIdentifierName(childrenList)]
-                assert isinstance(childrenVarValue,
-                                  (nodes.ArrayExpression, nodes.CallExpression, nodes.StaticNode))
-                childrenList = childrenVarValue
-
-            if isinstance(childrenList, nodes.ObjectExpression):
-                # Slot definition - https://vuejs.org/guide/components/slots.html
-                string = self.parseSlots(childrenList)
-            elif isinstance(childrenList, nodes.Literal) and childrenList.value is None:
-                # 'null'
-                string = None
-                children = None
-            elif (isinstance(childrenList, nodes.StaticNode) and
-                  not isinstance(childrenList, nodes.ArrayExpression)):
-                string = off + TABULATOR + str(childrenList.toData(self.ast)).strip()
-            elif isinstance(childrenList, nodes.CallExpression):
-                string = self.parseTemplate(childrenList)
-
-            if isinstance(childrenList, nodes.ArrayExpression):
-                childStrs = []
-                for child in self.ast.getNodes(childrenList.elements):
-                    assert isinstance(child, nodes.Node)
-                    if isinstance(child, nodes.StaticNode):
-                        childStrs.append(child.toDataStr(self.ast))
-                    else:
-                        childStrs.append(self.parseTemplate(child))
-                children = NL.join(childStrs)
-            elif string is not None:
-                if len(string) < OPTIONAL_LINE_WRAP and NL not in string:
-                    children = string.strip()
-                else:
-                    children = string
-            self.unTab()
-
-            if children is not None and children.endswith(NL):
-                children = children[:-len(NL)]
         if isinstance(nodeType, nodes.Identifier):
             # Identifier name, if found, rename
             if nodeType.name in BASE_VUE_COMPONENTS:
@@ -457,22 +406,62 @@ class TemplateParser:
             assert isinstance(nodeType, nodes.StaticNode)
             nodeType = nodeType.toData(self.ast)
 
-        if nodeType in VOID_ELEMENTS and children is not None:
+        if isinstance(childrenList, nodes.Identifier):
+            childrenVarValue = self.varPool[VueDecompiler.getIdentifierName(childrenList)]
+            assert isinstance(childrenVarValue,
+                              (nodes.ArrayExpression, nodes.CallExpression, nodes.StaticNode))
+            childrenList = childrenVarValue
+        if isinstance(childrenList, nodes.Literal) and childrenList.value is None:
+            childrenList = None  # 'null'
+        elif not isinstance(childrenList, (nodes.ObjectExpression, nodes.StaticNode,
+                                           nodes.CallExpression, nodes.ArrayExpression)):
+            childrenList = None
+
+        if childrenList is None:
+            self.out.emit(
+                f"{off}<{nodeType}{attributes}{'' if nodeType in VOID_ELEMENTS else ' /'}>")
+            return
+        if nodeType in VOID_ELEMENTS:
             raise ValueError(f"Void element {nodeType} cannot have children")
 
-        body: str = f"{NL}{children or ''}{NL}{off}"
-        if (children is not None and
-                len(children) < OPTIONAL_LINE_WRAP and
-                NL not in children):
-            body = children.strip()
-
-        if children is None:
-            return f"{off}<{nodeType}{attributes}{'' if nodeType in VOID_ELEMENTS else ' /'}>"
-        return f"{off}<{nodeType}{attributes}>{body}</{nodeType}>"
+        self.out.emit(f"{off}<{nodeType}{attributes}>")
+        bodyStart = self.out.mark()
+        self.out.emit(NL)
+        childrenStart = self.out.mark()
+
+        self.tab()
+        if isinstance(childrenList, nodes.ObjectExpression):
+            # Slot definition - https://vuejs.org/guide/components/slots.html
+            yield from self.parseSlots(childrenList)
+        elif isinstance(childrenList, nodes.ArrayExpression):
+            for i, child in enumerate(self.ast.getNodes(childrenList.elements)):
+                assert isinstance(child, nodes.Node)
+                if i > 0:
+                    self.out.emit(NL)
+                if isinstance(child, nodes.StaticNode):
+                    self.out.emit(child.toDataStr(self.ast))
+                else:
+                    yield child, None
+        elif isinstance(childrenList, nodes.StaticNode):
+            self.out.emit(off + TABULATOR + str(childrenList.toData(self.ast)).strip())
+        else:
+            yield childrenList, None
+        self.unTab()
+
+        self.out.removeSuffix(NL, childrenStart)
+        if (self.out.length(childrenStart) < OPTIONAL_LINE_WRAP and
+                not self.out.hasNewline(childrenStart)):
+            # Short enough to be on the same line as the tags
+            children = self.out.text(childrenStart).strip()
+            self.out.truncate(bodyStart)
+            self.out.emit(children)
+        else:
+            self.out.emit(f"{NL}{off}")
+        self.out.emit(f"</{nodeType}>")
 
     def parseCreateVNode(self, node: nodes.CallExpression,
                          addAttributes: dict[str, Any] | None = None,
-                         paramOverrides: dict[str, Any] | None = None) -> str:
+                         paramOverrides: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: type, props, children, patchFlag, dynamicProps, unknown1
         # return createBaseVNode(type, props, children, patchFlag, dynamicProps, <not an argument>,
         #   unknown1, true)
@@ -498,7 +487,7 @@ class TemplateParser:
             assert isinstance(nodeType, nodes.StaticNode)
             nodeType = nodeType.toData(self.ast)"""
 
-        return self.parseCreateBaseVNode(newNode, {
+        yield from self.parseCreateBaseVNode(newNode, {
             BVARGS.TYPE: params[VARGS.TYPE],  # nodeType,
             BVARGS.PROPS: params[VARGS.PROPS],
             BVARGS.CHILDREN: params[VARGS.CHILDREN],
@@ -511,7 +500,7 @@ class TemplateParser:
 
     def parseCreateStaticVNode(self, node: nodes.CallExpression,
                                addAttributes: dict[str, Any] | None = None,
-                               paramOverrides: dict[str, Any] | None = None) -> str:
+                               paramOverrides: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: type, props, children, staticCount
         # function createStaticVNode(e, t) {
         #     const r = createVNode(Static, null, e);
@@ -523,13 +512,14 @@ class TemplateParser:
         # This is to make sure the params provided won't be overwritten
         newNode = nodes.CallExpression(node.callee, [])
 
-        return self.parseCreateVNode(newNode, addAttributes, {
+        yield from self.parseCreateVNode(newNode, addAttributes, {
             VARGS.TYPE: "Static",  # nodeType,
             VARGS.PROPS: None,
             VARGS.CHILDREN: params[S_VARGS.CHILDREN]
         })
 
-    def parseCreateTextVNode(self, node: nodes.CallExpression) -> str:
+    def parseCreateTextVNode(self, node: nodes.CallExpression,
+                             addAttributes: dict[str, Any] | None = None):
         assert len(node.arguments) <= 2
 
         if len(node.arguments) == 0:
@@ -539,23 +529,26 @@ class TemplateParser:
             string = textNode.toString(self.ast, self.offset, False)
 
         if string.startswith('"') and string.endswith('"'):
-            return self.offset + string[1:-1]
-        return f"{self.offset}{{{string}}}"
+            self.out.emit(self.offset + string[1:-1])
+        else:
+            self.out.emit(f"{self.offset}{{{string}}}")
 
     def parseCreateElementBlock(self, node: nodes.CallExpression,
-                                addAttributes: dict[str, Any] | None = None) -> str:
+                                addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         assert len(node.arguments) <= 6
-        return self.setupBlock(
-            self.parseCreateBaseVNode(node, {BVARGS.UNKNOWN1: True}, addAttributes))
+        start = self.out.mark()
+        yield from self.parseCreateBaseVNode(node, {BVARGS.UNKNOWN1: True}, addAttributes)
+        self.setupBlock(start)
 
     def parseCreateBlock(self, node: nodes.CallExpression,
-                         addAttributes: dict[str, Any] | None = None) -> str:
+                         addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         assert len(node.arguments) <= 5
-        return self.setupBlock(
-            self.parseCreateBaseVNode(node, {BVARGS.SHAPE_FLAG: True}, addAttributes))
+        start = self.out.mark()
+        yield from self.parseCreateBaseVNode(node, {BVARGS.SHAPE_FLAG: True}, addAttributes)
+        self.setupBlock(start)
 
     def parseRenderList(self, node: nodes.CallExpression,
-                        addAttributes: dict[str, Any] | None = None) -> str:
+                        addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: list, render method, ?, ?
         # assert 2 <= len(node.arguments) <= 4
         assert len(node.arguments) == 2
@@ -574,15 +567,13 @@ class TemplateParser:
             argumentsStr = "(" + ", ".join(args) + ")"
 
         self.ctxVForCount += 1
-        VForContent = self.parseRenderMethod(renderMethod, {
+        yield from self.parseRenderMethod(renderMethod, {
             "v-for": f"{argumentsStr} in {srcIterable}"
         })
         self.ctxVForCount -= 1
 
-        return VForContent
-
     def parseRenderSlot(self, node: nodes.CallExpression,
-                        addAttributes: dict[str, Any] | None = None) -> str:
+                        addAttributes: dict[str, Any] | None = None):
         assert 2 <= len(node.arguments) <= 5  # Throw away
         # assert len(node.arguments) == 2
         # TODO Maybe the additional arguments have effect?
@@ -595,26 +586,26 @@ class TemplateParser:
         # TODO Use createVNode or something
         # TODO More arguments possible
 
-        return f"{self.offset}<slot{f"name={self.surroundString(slotName)}" if slotName != "default" else ''} />"
+        self.out.emit(f"{self.offset}<slot{f"name={self.surroundString(slotName)}" if slotName != "default" else ''} />")
 
     def parseToDisplayString(self, node: nodes.CallExpression,
-                             addAttributes: dict[str, Any] | None = None) -> str:
+                             addAttributes: dict[str, Any] | None = None):
         # Params as following: string
         assert len(node.arguments) == 1
         string = nodes.getAstNode(self.ast, node.arguments[0])
         stringStr = string.toString(self.ast, self.offset, False).strip()
-        return f"{self.offset}{{{stringStr}}}"
+        self.out.emit(f"{self.offset}{{{stringStr}}}")
 
     def parseWithCtx(self, node: nodes.CallExpression,
-                     addAttributes: dict[str, Any] | None = None) -> str:
+                     addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: render method, ?, ?
         assert len(node.arguments) == 1
         renderMethod = nodes.getAstNode(self.ast, node.arguments[0])
         assert isinstance(renderMethod, nodes.ArrowFunctionExpression), "Invalid withCtx argument"
-        return self.parseRenderMethod(renderMethod, addAttributes)
+        yield from self.parseRenderMethod(renderMethod, addAttributes)
 
     def parseWithDirectives(self, node: nodes.CallExpression,
-                            addAttributes: dict[str, Any] | None = None) -> str:
+                            addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         # Params as following: node, ?
         # TODO With directives - v-model
         assert 1 <= len(node.arguments) <= 2
@@ -624,10 +615,10 @@ class TemplateParser:
             addAttributes = {}
         addAttributes["v-model"] = "TODO"
 
-        return self.parseTemplate(node, addAttributes)
+        yield node, addAttributes
 
     def parseRenderMethod(self, node: nodes.ArrowFunctionExpression,
-                          addAttributes: dict[str, Any] | None = None) -> str:
+                          addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         body = nodes.getAstNode(self.ast, node.body)
         if isinstance(body, nodes.BlockStatement):
             # () => {
@@ -644,12 +635,67 @@ class TemplateParser:
             # Or anything else
             returnThing = body
 
-        renderedString = self.parseTemplate(returnThing, addAttributes)
-        return renderedString
+        yield returnThing, addAttributes
+
+    def parseCreateCommentVNode(self, node: nodes.CallExpression,
+                                addAttributes: dict[str, Any] | None = None):
+        pass  # Comments aren't rendered
+
+    # Vue runtime helper name --> handler(parser, node, addAttributes=...), see registerHelper
+    helpers: dict[str, THelperHandler] = {
+        "createBaseVNode": parseCreateBaseVNode,
+        "createVNode": parseCreateVNode,
+        "createStaticVNode": parseCreateStaticVNode,
+        "createTextVNode": parseCreateTextVNode,
+        "createElementBlock": parseCreateElementBlock,
+        "createBlock": parseCreateBlock,
+        "renderList": parseRenderList,
+        "renderSlot": parseRenderSlot,
+        "toDisplayString": parseToDisplayString,
+        "withCtx": parseWithCtx,
+        "withDirectives": parseWithDirectives,
+        "createCommentVNode": parseCreateCommentVNode,
+    }
+
+    @classmethod
+    def registerHelper(cls, name: str, handler: THelperHandler):
+        """
+        Makes parseTemplate render calls of the named Vue runtime helper with the handler,
+        replacing the current one. Registering on a subclass doesn't affect its parents.
+        """
+        if "helpers" not in cls.__dict__:
+            cls.helpers = dict(cls.helpers)
+        cls.helpers[name] = handler
 
     # Template parser
-    def parseTemplate(self, node: nodes.Node, addAttributes: dict[str, Any] | None = None) -> str:
-        """Converts a template node into its string representation."""
+    def parseTemplate(self, node: nodes.Node, addAttributes: dict[str, Any] | None = None):
+        """
+        Converts a template node into its string representation, emitted to out. The nesting is
+        kept on an explicit stack of the nodes' render steps instead of the call stack, so that
+        deep templates don't hit the recursion limit.
+        """
+        stack: list[TRenderSteps | None] = [self.templateSteps(node, addAttributes)]
+        while stack:
+            steps = stack[-1]
+            request = next(steps, None) if steps is not None else None
+            if request is None:
+                stack.pop()
+            else:
+                stack.append(self.templateSteps(*request))
+
+    def templateSteps(self, node: nodes.Node,
+                      addAttributes: dict[str, Any] | None = None) -> TRenderSteps | None:
+        """Starts rendering the node, returning the steps to finish it, if there are any."""
+        if isinstance(node, nodes.CallExpression):
+            funcName = VueDecompiler.getIdentifierName(self.ast.getNode(node.callee))
+            handler = self.helpers.get(funcName)
+            if handler is None:
+                raise NotImplementedError(f"Unsupported function: {funcName}")
+            return handler(self, node, addAttributes=addAttributes)
+        return self.parseExpression(node, addAttributes)
+
+    def parseExpression(self, node: nodes.Node,
+                        addAttributes: dict[str, Any] | None = None) -> TRenderSteps:
         if isinstance(node, nodes.SequenceExpression):
             first = self.ast.getNode(node.expressions[0])
             assert isinstance(first, nodes.CallExpression)
@@ -663,45 +709,28 @@ class TemplateParser:
                 self.openBlock(bool(what.toData(self.ast)))
 
             second = nodes.getAstNode(self.ast, node.expressions[1])
-            result = self.parseTemplate(second, addAttributes=addAttributes)
-            return result
-        elif isinstance(node, nodes.CallExpression):
-            funcName = VueDecompiler.getIdentifierName(self.ast.getNode(node.callee))
-            if funcName == "createBaseVNode":
-                return self.parseCreateBaseVNode(node, addAttributes=addAttributes)
-            elif funcName == "createVNode":
-                return self.parseCreateVNode(node, addAttributes=addAttributes)
-            elif funcName == "createStaticVNode":
-                return self.parseCreateStaticVNode(node, addAttributes=addAttributes)
-            elif funcName == "createTextVNode":
-                return self.parseCreateTextVNode(node)
-            elif funcName == "createElementBlock":
-                return self.parseCreateElementBlock(node, addAttributes=addAttributes)
-            elif funcName == "createBlock":
-                return self.parseCreateBlock(node, addAttributes=addAttributes)
-            elif funcName == "renderList":
-                return self.parseRenderList(node, addAttributes=addAttributes)
-            elif funcName == "renderSlot":
-                return self.parseRenderSlot(node, addAttributes=addAttributes)
-            elif funcName == "toDisplayString":
-                return self.parseToDisplayString(node, addAttributes=addAttributes)
-            elif funcName == "withCtx":
-                return self.parseWithCtx(node, addAttributes=addAttributes)
-            elif funcName == "withDirectives":
-                return self.parseWithDirectives(node, addAttributes=addAttributes)
-            elif funcName == "createCommentVNode":
-                return ""
-            else:
-                raise NotImplementedError(f"Unsupported function: {funcName}")
+            yield second, addAttributes
         elif isinstance(node, nodes.Identifier):
             # If it's a static node reference
             varName = VueDecompiler.getIdentifierName(node)
             assert varName in self.varPool
-            call = self.varPool[varName]
-            self.component.mapFunctions(call, False, True)
-            return self.parseTemplate(call, addAttributes)
+            # Hoisted vnodes are often referenced many times, they're only rendered once
+            # for each of the states that change their output
+            key = (varName, self.offsetCount, self.ctxVForCount > 0, self.usedComponentsKey,
+                   tuple(addAttributes.items()) if addAttributes else ())
+            rendered = self.sourceFile.hoistedTemplates.get(key)
+            if rendered is not None:
+                self.out.emit(rendered)
+            else:
+                call = self.varPool[varName]
+                if varName not in self.sourceFile.mappedHoists:
+                    self.sourceFile.mappedHoists.add(varName)
+                    self.component.mapFunctions(call, False, True)
+                start = self.out.mark()
+                yield call, addAttributes
+                self.sourceFile.hoistedTemplates[key] = self.out.text(start)
         elif isinstance(node, nodes.Literal):
-            return f"{self.offset}{node.type}"
+            self.out.emit(f"{self.offset}{node.type}")
         elif isinstance(node, nodes.ConditionalExpression):
             # TODO implement v-else-if
             ifBranch = nodes.getAstNode(self.ast, node.consequent)
@@ -709,26 +738,37 @@ class TemplateParser:
             ifCheck = nodes.getAstNode(self.ast, node.test)
 
             ifCheckStr = ifCheck.toString(self.ast, self.offset, False)
-            ifBranchStr = self.parseTemplate(ifBranch, {"v-if": ifCheckStr})
-            elseBranchStr = self.parseTemplate(elseBranch, {"v-else": None})
-
-            if ifBranchStr.strip() == "":  # ifCheck ? <comment> : elseBranch
-                newTest = self.ast.addNode(nodes.UnaryExpression("!", self.ast.addNode(ifCheck)))
-                newCondition = nodes.ConditionalExpression(newTest, self.ast.addNode(elseBranch),
-                                                           self.ast.addNode(ifBranch))
-                return self.parseTemplate(newCondition, addAttributes)
-
-            if not elseBranchStr:
-                return ifBranchStr
-            return ifBranchStr + NL + elseBranchStr
+            ifStart = self.out.mark()
+            yield ifBranch, {"v-if": ifCheckStr}
+            ifBlank = self.out.isBlank(ifStart)
+            ifEnd = self.out.mark()
+            self.out.emit(NL)
+            elseStart = self.out.mark()
+            yield elseBranch, {"v-else": None}
+
+            if ifBlank:  # ifCheck ? <comment> : elseBranch
+                elseBlank = self.out.isBlank(elseStart)
+                self.out.truncate(ifStart)
+                if not elseBlank:  # Otherwise there's nothing to render, swapping wouldn't end
+                    newTest = self.ast.addNode(
+                        nodes.UnaryExpression("!", self.ast.addNode(ifCheck)))
+                    newCondition = nodes.ConditionalExpression(newTest,
+                                                               self.ast.addNode(elseBranch),
+                                                               self.ast.addNode(ifBranch))
+                    yield newCondition, addAttributes
+            elif self.out.length(elseStart) == 0:
+                self.out.truncate(ifEnd)
         elif isinstance(node, nodes.ArrayExpression):
-            contentNodes = map(lambda x: self.parseTemplate(nodes.getAstNode(self.ast, x)),
-                               node.elements)
-            return NL.join(contentNodes)
-        raise NotImplementedError(f"Unsupported node type {node.type}")
+            for i, element in enumerate(node.elements):
+                if i > 0:
+                    self.out.emit(NL)
+                yield nodes.getAstNode(self.ast, element), None
+        else:
+            raise NotImplementedError(f"Unsupported node type {node.type}")
 
     # The entry point
     def parse(self, renderMethod: nodes.FunctionDeclaration) -> str:
+        self.out = Emitter()
         self.usedComponentsPool.clear()
         self.varPool = self.extractVarPool()
         self.blockStack.clear()
@@ -744,8 +784,10 @@ class TemplateParser:
             if not isinstance(varDeclaration, nodes.VariableDeclaration):
                 continue
             self.extractUsedComponents(varDeclaration)
+        self.usedComponentsKey = frozenset(self.usedComponentsPool.items())
         returnStatement = self.ast.getNode(body.body[-1])
         assert isinstance(returnStatement, nodes.ReturnStatement)
         returnThing = self.ast.getNode(returnStatement.argument)
         assert isinstance(returnThing, nodes.Node)
-        return self.parseTemplate(returnThing)
+        self.parseTemplate(returnThing)
+        return self.out.getValue()
@@ -1,18 +1,27 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
 
+import contextlib
 import json
+import multiprocessing
+import os
+import random
+import zlib
+from typing import NamedTuple
 
 from kutil.io import enumFiles
 from kutil.language.AST import ASTNode, AST
 from kutil.language.languages.javascript import nodes
 from kutil.language.languages.javascript.syntax import JSNode
 
-from vuedec.Cache import Cache
+from vuedec.Cache import Cache, CacheStats
 from vuedec.Component import Component
-from vuedec.DecompilerUI import DecompilerUI, CmdUI
+from vuedec.DecompilerUI import DecompilerUI, CmdUI, RecordingUI, TEvent
 from vuedec.Files import Files
+from vuedec.Instrumentation import Instrumentation, NullInstrumentation, TRecords
 from vuedec.JSParser import JSParser
+from vuedec.Profiler import ChunkProfiler, ChunkProfile
+from vuedec.SymbolTable import SymbolTable
 
 
 class VueDecompiler:
@@ -20,37 +29,152 @@ class VueDecompiler:
     target: Files
     cache: str
     ui: DecompilerUI
-    decompiledCache: Cache
+    decompiledCache: Cache  # file name --> {"hash", "functionMap", "components"}
     mainFileName: str
+    incremental: bool
+    beautify: bool
+    instrumentation: Instrumentation
+    profiler: ChunkProfiler | None
 
     functionMap: dict[str, str]  # index.js --> exported
     functionReversedMap: dict[str, str]  # exported --> index.js
-
-    def __init__(self, source: str, target: str, cache: str):
+    functionMapHash: str
+
+    def __init__(self, source: str, target: str, cache: str, incremental: bool = False,
+                 beautify: bool = True, instrumentation: Instrumentation | None = None,
+                 profiler: ChunkProfiler | None = None):
+        """
+        With incremental set, the already decompiled files are skipped as long as neither
+        they nor the main file's function map changed, and their components are still present
+        in the target directory. With beautify unset, the files are parsed without
+        being beautified first. The instrumentation records the phases of the decompiling
+        (including the worker processes' ones), disabled by default. With a profiler,
+        the decompiling of every chunk file is profiled separately.
+        """
         self.source = Files(source)
         self.target = Files(target)
         self.cache = cache
         self.decompiledCache = Cache("vue-decompiler", cache)
         self.ui = CmdUI()
         self.mainFileName = "index.js"
+        self.incremental = incremental
+        self.beautify = beautify
+        self.instrumentation = instrumentation or NullInstrumentation()
+        self.profiler = profiler
 
         self.functionMap = {}
         self.functionReversedMap = {}
+        self.functionMapHash = ""
+
+    def openFile(self, file_name: str, parse=False) -> JSParser:
+        return JSParser(self.source, file_name, self.ui, self.cache, immediately_parse=parse,
+                        beautify=self.beautify, instrumentation=self.instrumentation)
+
+    def profileChunk(self, file_name: str):
+        """A context manager profiling the decompiling of the chunk file, if profiling."""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.profile(file_name)
 
     def set_ui(self, new_ui):
         if not isinstance(new_ui, DecompilerUI):
             raise TypeError("Bad UI class")
         self.ui = new_ui
 
-    def decompile(self):
+    def decompile(self, jobs: int = 1):
+        """
+        Decompiles all the chunk files. With jobs other than 1, the chunks are decompiled
+        by a pool of worker processes (jobs=0 uses all the CPU cores), whose progress events
+        are replayed on the UI as their files finish. The run finishes with the stats of all
+        the caches (including the workers' use of them).
+        """
         f = self.source
         u = self.ui
         if not f.has(self.mainFileName):
             self.mainFileName = u.ask("Enter main file name (note that a bad name may break the"
                                       " code because of import specifier mapping): ")
-        i = JSParser(f, self.mainFileName, u, self.cache, immediately_parse=False)
+        i = self.openFile(self.mainFileName)
         self.extractFunctionNames(i)
         # print(self.functionMap)
+        chunkFiles = [self.openFile(other_file_name) for other_file_name in self.findChunkFiles()]
+
+        self.forgetRemovedFiles({other_file.file_name for other_file in chunkFiles})
+        if self.incremental:
+            chunkFiles = [other_file for other_file in chunkFiles
+                          if not self.isUpToDate(other_file)]
+        # Delete the previous outputs before writing anything, a component might have moved
+        # to another file, which could be decompiled earlier
+        with self.decompiledCache.batch():
+            for other_file in chunkFiles:
+                self.deleteFileComponents(other_file.file_name)
+
+        u.runStarted(len(chunkFiles))
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(chunkFiles))
+        if jobs <= 1:
+            for other_file in chunkFiles:
+                with self.profileChunk(other_file.file_name):
+                    self.decompileFile(other_file)
+            u.runFinished(self.cacheStats())
+            return
+
+        # Spawned (not forked) workers wouldn't see the Cache settings otherwise
+        cacheSettings = {"compression": Cache.compression,
+                         "compressionLevel": Cache.compressionLevel,
+                         "maxBytes": Cache.maxBytes, "maxEntries": Cache.maxEntries}
+        initArgs = (self.source.path, self.target.path, self.cache, self.beautify,
+                    self.mainFileName, self.functionMap, self.functionReversedMap, cacheSettings,
+                    self.instrumentation.enabled,
+                    self.profiler.settings if self.profiler is not None else None)
+        chunkFileNames = [other_file.file_name for other_file in chunkFiles]
+        with multiprocessing.Pool(jobs, _initWorker, initArgs) as pool:
+            JSParser.prebeautify(chunkFiles, pool)
+            # imap keeps the file order, so the duplicate component detection is deterministic
+            for result in pool.imap(_decompileInWorker, chunkFileNames):
+                RecordingUI.replay(result.events, u)
+                self.instrumentation.merge(result.records)
+                if self.profiler is not None:
+                    self.profiler.merge(result.profiles)
+                Cache.mergeStats(result.cacheStats)
+                self.saveFileComponents(result.file_name, result.hash, result.outputs)
+                u.fileFinished(result.file_name, [name for name, _ in result.outputs])
+        u.runFinished(self.cacheStats())
+
+    @staticmethod
+    def cacheStats() -> dict[str, dict]:
+        """Cache name --> its stats as a dict, see Cache.allStats."""
+        return {name: stats.asDict() for name, stats in sorted(Cache.allStats().items())}
+
+    def prune(self) -> int:
+        """Drops the cache entries of files no longer present in the source directory (and of
+        their previous versions), returning the number of dropped entries."""
+        fileNames = self.findChunkFiles()
+        if self.source.has(self.mainFileName):
+            fileNames.append(self.mainFileName)
+
+        liveKeys: set[str] = set()
+        for file_name in fileNames:
+            liveKeys.update(self.openFile(file_name).cacheKeys())
+
+        pruned = 0
+        parserCache = Cache("js-parser", self.cache)
+        with parserCache.batch():
+            for key in parserCache.keys():
+                if key not in liveKeys:
+                    parserCache.delete(key)
+                    pruned += 1
+        with self.decompiledCache.batch():
+            for file_name in self.decompiledCache.keys():
+                if file_name not in fileNames:
+                    self.decompiledCache.delete(file_name)
+                    pruned += 1
+        parserCache.collectBlobs()
+        return pruned
+
+    def findChunkFiles(self) -> list[str]:
+        f = self.source
+        chunkFileNames = []
         for other_file_name, _ in enumFiles(f.path, extendedInfo=False):
             assert f.has(other_file_name), f"No such file '{other_file_name}' found"  # Wtf
 
@@ -58,48 +182,92 @@ class VueDecompiler:
                     other_file_name.endswith(".js") and not other_file_name.endswith(
                 ".min.js")) or not other_file_name[0].istitle():
                 continue
-
-            other_file = JSParser(f, other_file_name, u, self.cache)
-            self.decompileFile(other_file)
+            chunkFileNames.append(other_file_name)
+        return chunkFileNames
+
+    def isUpToDate(self, parser: JSParser) -> bool:
+        """Whether the file was decompiled from the same content and function map before
+        and all of its components are still in the target directory."""
+        record = self.decompiledCache.get(parser.file_name)
+        if record is None:
+            return False
+        if record["hash"] != parser.contentHash() or record["functionMap"] != self.functionMapHash:
+            return False
+        return all(self.target.has(f"{name}.vue") for name in record["components"])
+
+    def forgetRemovedFiles(self, existingFileNames: set[str]):
+        """Deletes the components decompiled from files that no longer exist."""
+        with self.decompiledCache.batch():
+            for file_name in self.decompiledCache.keys():
+                if file_name not in existingFileNames:
+                    self.deleteFileComponents(file_name)
+
+    def deleteFileComponents(self, file_name: str, save=True):
+        record = self.decompiledCache.get(file_name)
+        if record is None:
+            return
+        for componentName in record["components"]:
+            self.target.delete(f"{componentName}.vue")
+        self.decompiledCache.delete(file_name, save)
+
+    def saveFileComponents(self, file_name: str, hash: str, outputs: list[tuple[str, str]]):
+        # Components of the file's previous version, which might have been renamed or removed
+        # (a no-op when called from decompile, which deletes them upfront)
+        self.deleteFileComponents(file_name, save=False)
+        with self.instrumentation.phase("write", file_name,
+                                        byteCount=sum(len(output) for _, output in outputs)):
+            self.writeComponents(outputs)
+        self.decompiledCache.set(file_name, {
+            "hash": hash,
+            "functionMap": self.functionMapHash,
+            "components": [name for name, _ in outputs]
+        })
 
     def extractFunctionNames(self, indexJS: JSParser):
         c = Cache("vue-decompiler-fn-map", self.cache)
 
-        if c.has("map") and c.has("map-reversed"):
+        indexHash = indexJS.contentHash()
+        hit = c.has("map") and c.has("map-reversed") and c.get("hash") == indexHash
+        self.ui.cacheAccess(c.name, "map", hit)
+        if hit:
             self.functionMap = c.get("map")
             self.functionReversedMap = c.get("map-reversed")
+            self.functionMapHash = c.get("map-hash")
             return
 
         indexJS.parse()
 
         ast: AST = indexJS.ast
-        moduleNodes: list[ASTNode] = ast.getNodes(indexJS.entryPoint.body)
 
-        self.functionMap = {}
-        self.functionReversedMap = {}
-        for export in self.findExports(moduleNodes):
-            for spec in ast.getNodes(export.specifiers):
-                assert isinstance(spec, nodes.ExportSpecifier)
-
-                localName: str = self.getIdentifierName(
-                    ast.getNode(spec.local))  # .partition("$")[0] # I forgot why
-                exportedName: str = self.getIdentifierName(ast.getNode(spec.exported))
-
-                assert localName not in self.functionMap
-                assert exportedName not in self.functionReversedMap
-                self.functionMap[localName] = exportedName
-                self.functionReversedMap[exportedName] = localName
-        c.set("map", self.functionMap)
-        c.set("map-reversed", self.functionReversedMap)
-        c.save()
-
-    def extractImportedFunctionNames(self, moduleNodes: list[ASTNode], ast: AST) \
+        with self.instrumentation.phase("fn-map", indexJS.file_name):
+            self.functionMap = {}
+            self.functionReversedMap = {}
+            for export in indexJS.symbols.exports:
+                for spec in ast.getNodes(export.specifiers):
+                    assert isinstance(spec, nodes.ExportSpecifier)
+
+                    localName: str = self.getIdentifierName(
+                        ast.getNode(spec.local))  # .partition("$")[0] # I forgot why
+                    exportedName: str = self.getIdentifierName(ast.getNode(spec.exported))
+
+                    assert localName not in self.functionMap
+                    assert exportedName not in self.functionReversedMap
+                    self.functionMap[localName] = exportedName
+                    self.functionReversedMap[exportedName] = localName
+            self.functionMapHash = "%08X" % zlib.crc32(
+                json.dumps(self.functionMap, sort_keys=True).encode("utf-8"))
+        with c.batch():
+            c.set("map", self.functionMap)
+            c.set("map-reversed", self.functionReversedMap)
+            c.set("map-hash", self.functionMapHash)
+            c.set("hash", indexHash)
+
+    def extractImportedFunctionNames(self, symbols: SymbolTable, ast: AST) \
             -> tuple[dict[str, str], dict[str, str]]:
         functionMap = {}  # defineComponent --> v
         functionReversedMap = {}  # v --> defineComponent
 
-        imports = self.findImports(moduleNodes)
-        for importNode in imports:
+        for importNode in symbols.imports:
             assert isinstance(importNode, nodes.ImportDeclaration)
             srcName: str = self.getLiteralStr(ast.getNode(importNode.source))
             if self.absPath(srcName) != self.mainFileName:
@@ -137,34 +305,23 @@ class VueDecompiler:
     def findImports(moduleNodes: list[ASTNode]) -> list[nodes.ImportDeclaration]:
         return list(filter(lambda node: node.type is JSNode.ImportDeclaration, moduleNodes))
 
-    def findVarDeclarator(self, name: str, moduleNodes: list[ASTNode],
-                          ast: AST) -> nodes.VariableDeclarator:
-        for node in moduleNodes:
-            if node.type is JSNode.VariableDeclaration:
-                assert isinstance(node, nodes.VariableDeclaration)
-                for declarator in ast.getNodes(node.declarations):
-                    assert isinstance(declarator, nodes.VariableDeclarator)
-                    cmpName = self.getIdentifierName(ast.getNode(declarator.id))
-                    if cmpName == name:
-                        return declarator
-
-        raise KeyError(f"Variable {name} declaration not found")
-
-    def findMethodDeclarator(self, name: str, moduleNodes: list[ASTNode],
-                             ast: AST) -> nodes.FunctionDeclaration:
-        for node in moduleNodes:
-            if node.type is JSNode.FunctionDeclaration:
-                assert isinstance(node, nodes.FunctionDeclaration)
-
-                cmpName = self.getIdentifierName(ast.getNode(node.id))
-                if cmpName == name:
-                    return node
+    @staticmethod
+    def findVarDeclarator(name: str, symbols: SymbolTable) -> nodes.VariableDeclarator:
+        try:
+            return symbols.variables[name]
+        except KeyError:
+            raise KeyError(f"Variable {name} declaration not found") from None
 
-        raise KeyError(f"Function {name} declaration not found")
+    @staticmethod
+    def findMethodDeclarator(name: str, symbols: SymbolTable) -> nodes.FunctionDeclaration:
+        try:
+            return symbols.functions[name]
+        except KeyError:
+            raise KeyError(f"Function {name} declaration not found") from None
 
-    def findMethodCall(self, returnToVarName: str, moduleNodes: list[ASTNode],
+    def findMethodCall(self, returnToVarName: str, symbols: SymbolTable,
                        ast: AST) -> nodes.CallExpression:
-        var = self.findVarDeclarator(returnToVarName, moduleNodes, ast)
+        var = self.findVarDeclarator(returnToVarName, symbols)
         call = ast.getNode(var.init)
         assert isinstance(call, nodes.CallExpression)
         return call
@@ -176,85 +333,77 @@ class VueDecompiler:
         returnKnown: Component | None = None
         returnOthers: list[Component] = []
         componentByName: dict[str, Component] = {}
+        symbols = srcFile.symbols
+
+        for cmpName, declarator in symbols.declarators:
+            if declarator.init is None:
+                continue
 
-        for node in moduleNodes:
-            if node.type is JSNode.VariableDeclaration:
-                assert isinstance(node, nodes.VariableDeclaration)
-                for declarator in ast.getNodes(node.declarations):
-                    assert isinstance(declarator, nodes.VariableDeclarator)
-                    cmpName = self.getIdentifierName(ast.getNode(declarator.id))
-
-                    if declarator.init is None:
-                        continue
-
-                    componentVarInit = ast.getNode(declarator.init)
-                    if not isinstance(componentVarInit, nodes.CallExpression):
-                        continue
-
-                    callee = ast.getNode(componentVarInit.callee)
-
-                    if not isinstance(callee, nodes.Identifier):
-                        continue
-                    print(callee.name, fnMap.get(callee.name))
-                    # TODO Fix
-
-                    if self.isIdentifierName(callee,
-                                             "_export_sfc",
-                                             fnMap):
-                        definitionName = self.getIdentifierName(
-                            ast.getNode(componentVarInit.arguments[0]))
-                        infoList = ast.getNode(componentVarInit.arguments[1])
-                        assert isinstance(infoList, nodes.ArrayExpression)
-                        renderList = ast.getNode(infoList.elements[0])
-                        assert isinstance(renderList, nodes.ArrayExpression)
-                        assert self.getLiteralStr(ast.getNode(renderList.elements[0]))
-                        renderFnName = self.getIdentifierName(ast.getNode(renderList.elements[1]))
-
-                        try:
-                            cmpDefinitionCall = self.findMethodCall(definitionName, moduleNodes,
-                                                                    ast)
-                        except AssertionError:
-                            cmpDefinitionCall = None
-                    else:
-                        cmpDefinitionCall = componentVarInit
-
-                        if not self.isIdentifierName(ast.getNode(cmpDefinitionCall.callee),
-                                                     "defineComponent", fnMap):
-                            continue
-
-                        renderFnName = None
-
-                    if cmpDefinitionCall is not None:
-                        assert self.isIdentifierName(ast.getNode(cmpDefinitionCall.callee),
-                                                     "defineComponent", fnMap)
-                        cmpDefinition = ast.getNode(cmpDefinitionCall.arguments[0])
-                        assert isinstance(cmpDefinition, nodes.ObjectExpression)
-                    else:
-                        cmpDefinition = None
-
-                    renderMethod = self.findMethodDeclarator(renderFnName, moduleNodes,
-                                                             ast) if renderFnName else None
-
-                    cmp: Component = Component(srcFile, ast, moduleNodes, cmpDefinition,
-                                               renderMethod, fnMap, fnReverseMap, self.mainFileName)
-
-                    componentName = cmp.extractName()
-                    if componentName in componentByName:
-                        # Unregister the component
-                        # Basically, defineComponent is considered a component
-                        # before _export_sfc occurs, tricking the program into
-                        # thinking there were 2 components of such name
-                        if componentByName[componentName] in returnOthers:
-                            returnOthers.remove(componentByName[componentName])
-                        srcFile.unregisterComponent(componentName)
-                    componentByName[componentName] = cmp
-                    srcFile.registerComponent(cmp, componentName, cmpName,
-                                              declarator)
-
-                    if cmpName == knownName:
-                        returnKnown = cmp
-                    else:
-                        returnOthers.append(cmp)
+            componentVarInit = ast.getNode(declarator.init)
+            if not isinstance(componentVarInit, nodes.CallExpression):
+                continue
+
+            callee = ast.getNode(componentVarInit.callee)
+
+            if not isinstance(callee, nodes.Identifier):
+                continue
+
+            if self.isIdentifierName(callee,
+                                     "_export_sfc",
+                                     fnMap):
+                definitionName = self.getIdentifierName(
+                    ast.getNode(componentVarInit.arguments[0]))
+                infoList = ast.getNode(componentVarInit.arguments[1])
+                assert isinstance(infoList, nodes.ArrayExpression)
+                renderList = ast.getNode(infoList.elements[0])
+                assert isinstance(renderList, nodes.ArrayExpression)
+                assert self.getLiteralStr(ast.getNode(renderList.elements[0]))
+                renderFnName = self.getIdentifierName(ast.getNode(renderList.elements[1]))
+
+                try:
+                    cmpDefinitionCall = self.findMethodCall(definitionName, symbols, ast)
+                except AssertionError:
+                    cmpDefinitionCall = None
+            else:
+                cmpDefinitionCall = componentVarInit
+
+                if not self.isIdentifierName(ast.getNode(cmpDefinitionCall.callee),
+                                             "defineComponent", fnMap):
+                    continue
+
+                renderFnName = None
+
+            if cmpDefinitionCall is not None:
+                assert self.isIdentifierName(ast.getNode(cmpDefinitionCall.callee),
+                                             "defineComponent", fnMap)
+                cmpDefinition = ast.getNode(cmpDefinitionCall.arguments[0])
+                assert isinstance(cmpDefinition, nodes.ObjectExpression)
+            else:
+                cmpDefinition = None
+
+            renderMethod = self.findMethodDeclarator(renderFnName,
+                                                     symbols) if renderFnName else None
+
+            cmp: Component = Component(srcFile, ast, moduleNodes, cmpDefinition,
+                                       renderMethod, fnMap, fnReverseMap, self.mainFileName)
+
+            componentName = cmp.extractName()
+            if componentName in componentByName:
+                # Unregister the component
+                # Basically, defineComponent is considered a component
+                # before _export_sfc occurs, tricking the program into
+                # thinking there were 2 components of such name
+                if componentByName[componentName] in returnOthers:
+                    returnOthers.remove(componentByName[componentName])
+                srcFile.unregisterComponent(componentName)
+            componentByName[componentName] = cmp
+            srcFile.registerComponent(cmp, componentName, cmpName,
+                                      declarator)
+
+            if cmpName == knownName:
+                returnKnown = cmp
+            else:
+                returnOthers.append(cmp)
         if returnKnown is None:
             raise KeyError(f"Component '{knownName}' declaration not found")
 
@@ -281,35 +430,97 @@ class VueDecompiler:
         cmpName = self.getIdentifierName(identifier)
         return cmpName == fnMap[name]
 
-    def decompileFile(self, parser: JSParser) -> str:
-        assert parser.ast is not None and parser.entryPoint is not None
-        if self.decompiledCache.has(parser.file_name):
-            return self.decompiledCache.get(parser.file_name)
-
-        print(f"Decompiling {parser.file_name}", end="")
-
+    def decompileFile(self, parser: JSParser) -> list[str]:
+        """Parses (unless parsed already), decompiles and writes all the components of a file,
+        returning their names."""
+        if self.incremental and self.isUpToDate(parser):
+            return self.decompiledCache.get(parser.file_name)["components"]
+
+        self.ui.fileStarted(parser.file_name)
+        parser.parse()
+        outputs = self.renderFile(parser)
+        self.saveFileComponents(parser.file_name, parser.contentHash(), outputs)
+        componentNames = [name for name, _ in outputs]
+        self.ui.fileFinished(parser.file_name, componentNames)
+        return componentNames
+
+    def renderFile(self, parser: JSParser) -> list[tuple[str, str]]:
+        """Decompiles all the components of a file without writing them,
+        returning a list of (component name, .vue file content)."""
         ast = parser.ast
         module = parser.entryPoint
         moduleNodes = ast.getNodes(module.body)
 
         # Map the functions
-        fnMap, fnReverseMap = self.extractImportedFunctionNames(moduleNodes, ast)
+        fnMap, fnReverseMap = self.extractImportedFunctionNames(parser.symbols, ast)
 
         # Find the component var name
-        export = self.findExports(moduleNodes)[0]
+        export = parser.symbols.exports[0]
         spec: ASTNode = ast.getNode(export.specifiers[0])
         assert isinstance(spec, nodes.ExportSpecifier)
         componentVarName = self.getIdentifierName(ast.getNode(spec.local))
         # print(componentVarName)
 
-        mainComponent, otherComponents = self.findComponentDefinitions(componentVarName,
-                                                                       moduleNodes, ast, fnMap,
-                                                                       fnReverseMap,
-                                                                       parser)
-        componentNames = [mainComponent.extractName()]
-
-        mainComponent.decompile(self.target)
-        for other in otherComponents:
-            other.decompile(self.target)
-            componentNames.append(other.extractName())
-        print(f" - DONE (components: {', '.join(componentNames)})")
+        with self.instrumentation.phase("discovery", parser.file_name):
+            mainComponent, otherComponents = self.findComponentDefinitions(componentVarName,
+                                                                           moduleNodes, ast,
+                                                                           fnMap, fnReverseMap,
+                                                                           parser)
+        outputs = []
+        for component in [mainComponent] + otherComponents:
+            name, output = component.extractName(), component.render()
+            outputs.append((name, output))
+            self.ui.componentEmitted(parser.file_name, name, len(output))
+        return outputs
+
+    def writeComponents(self, outputs: list[tuple[str, str]]):
+        for componentName, output in outputs:
+            if self.target.has(f"{componentName}.vue"):
+                raise RuntimeError(f"Component '{componentName}' already decompiled")
+            self.target.set(f"{componentName}.vue", output)
+
+
+_worker: VueDecompiler | None = None
+
+
+def _initWorker(source: str, target: str, cache: str, beautify: bool, mainFileName: str,
+                functionMap: dict[str, str], functionReversedMap: dict[str, str],
+                cacheSettings: dict, instrumented: bool,
+                profilerSettings: tuple[str, bool, int] | None):
+    global _worker
+    for name, value in cacheSettings.items():
+        setattr(Cache, name, value)
+    # Forked workers share the parent's random state, which would make
+    # the UnknownName_* component names collide between the workers
+    random.seed()
+    _worker = VueDecompiler(source, target, cache, beautify=beautify,
+                            instrumentation=Instrumentation() if instrumented else None,
+                            profiler=ChunkProfiler(*profilerSettings) if profilerSettings else None)
+    _worker.set_ui(RecordingUI())
+    _worker.mainFileName = mainFileName
+    _worker.functionMap = functionMap
+    _worker.functionReversedMap = functionReversedMap
+
+
+class _FileResult(NamedTuple):
+    """What a worker process hands over to the parent for every file it decompiled."""
+    file_name: str
+    hash: str
+    outputs: list[tuple[str, str]]
+    # The file's instrumentation records, profile, progress events and use of the caches,
+    # the parent merges them into its own
+    records: TRecords
+    profiles: list[ChunkProfile]
+    events: list[TEvent]
+    cacheStats: dict[str, CacheStats]
+
+
+def _decompileInWorker(file_name: str) -> _FileResult:
+    _worker.ui.fileStarted(file_name)
+    with _worker.profileChunk(file_name):
+        parser = _worker.openFile(file_name, parse=True)
+        outputs = _worker.renderFile(parser)
+    profiles = _worker.profiler.takeResults() if _worker.profiler is not None else []
+    return _FileResult(file_name, parser.contentHash(), outputs,
+                       _worker.instrumentation.takeRecords(), profiles, _worker.ui.takeEvents(),
+                       Cache.takeStats())
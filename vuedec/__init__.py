@@ -1,7 +1,11 @@
 #  -*- coding: utf-8 -*-
 __author__ = "kubik.augustyn@post.cz"
+__version__ = "0.1.0"
 
 from vuedec.VueDecompiler import VueDecompiler
-from vuedec.DecompilerUI import DecompilerUI, CmdUI
+from vuedec.Cache import Cache, CacheStats
+from vuedec.DecompilerUI import DecompilerUI, CmdUI, JSONLinesUI, RecordingUI
 from vuedec.Files import Files
+from vuedec.Instrumentation import Instrumentation, NullInstrumentation
 from vuedec.JSParser import JSParser
+from vuedec.Profiler import ChunkProfiler